@@ -1,16 +1,25 @@
-from user_context import UserContext
+from chat_sessions import sessions
+from memory_queue import create_memory_queue
+from attachments import upload_files, upload_cache
+from token_refresher import token_refresher
+from calendar_watch import create_calendar_watcher
 import os
 import json
+import asyncio
+from datetime import datetime
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request, Header
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse  # Add JSONResponse here
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import google.generativeai as genai
+from google.generativeai.types import content_types
 from dotenv import load_dotenv
 from utils.persona import *
 from plan_tools import *
 from google_auth import *
+from google_services import invalidate_services, service_cache
+from utils.concurrency import run_blocking, run_for_user, shutdown_executor
 from firebase_admin import firestore
 import warnings
 from google.cloud.firestore_v1.base_query import FieldFilter
@@ -46,20 +55,32 @@ tool_functions = [
     get_calendar_list,
     create_calendar_event,
     quick_add_event,
+    create_calendar_events_batch,
     get_calendar_events,
     delete_calendar_event,
     update_calendar_event,
     create_task,
+    create_tasks_batch,
     get_tasks,
     delete_task,
     update_task,
     clear_tasks,
     get_task_list,
     schedule_study_time,
-    get_saved_schedule
+    get_saved_schedule,
+    find_group_free_time
 ]
 
-history = []
+# Building the function declarations means introspecting every tool's
+# signature and docstring, so it is done once here and shared by all requests.
+tool_library = content_types.to_function_library(tool_functions)
+MODEL_NAME = 'gemini-1.5-flash-002'
+
+
+def build_model(memory):
+    # Only the per-user context block changes between requests; the persona
+    # text and tool declarations are the same shared objects every time.
+    return genai.GenerativeModel(model_name=MODEL_NAME, tools=tool_library, system_instruction=scio_persona(memory))
 
 
 class UserInput(BaseModel):
@@ -69,6 +90,99 @@ class ChatResponse(BaseModel):
     response: str
     function_calls: list
 
+CHAT_NOTES = "    Notes:  - Always use the appropriate function to perform actions. Do not claim to have done something without actually calling the function. If a function is available for a specific task, use it instead of providing information from your training data.  - Avoid displaying any sensitive information like function name to me, keep it to yourself and avoid unnecessary followup questions and KEEP YOUR RESPONSE IT AS CONCISE AS POSSIBLE  "
+
+
+# mem0 writes aren't needed to answer the current message, so they are
+# queued and written in the background.
+memory_queue = create_memory_queue(add_memory)
+
+
+# Follow-up messages within this many seconds reuse the memory retrieved for
+# the previous message of the session instead of searching again (0 = off).
+MEMORY_SNAPSHOT_SECONDS = int(os.environ.get("SCIO_MEMORY_SNAPSHOT_SECONDS", 0))
+
+
+async def recall_memory(message, user_id):
+    if not MEMORY_SNAPSHOT_SECONDS:
+        return await run_blocking(search_memory, message, user_id)
+    memory = sessions.memory_snapshot(user_id, MEMORY_SNAPSHOT_SECONDS)
+    if memory is None:
+        memory = await run_blocking(search_memory, message, user_id)
+        sessions.set_memory_snapshot(user_id, memory)
+    return memory
+
+
+def generate_reply(memory, contents):
+    # Runs on a worker thread: automatic function calling invokes the
+    # plan_tools functions synchronously from inside send_message.
+    model = build_model(memory)
+    chat = model.start_chat(enable_automatic_function_calling=True)
+    print("model init")
+    response = chat.send_message(contents)
+    return response.text
+
+
+def stream_reply(memory, contents, emit):
+    # Streaming and automatic function calling can't be combined in the SDK,
+    # so the function-calling loop is driven here. Text parts are emitted as
+    # they arrive and each tool call is announced before and after it runs.
+    model = build_model(memory)
+    chat = model.start_chat()
+    response = chat.send_message(contents, stream=True)
+    text = []
+    while True:
+        function_calls = []
+        for chunk in response:
+            if not chunk.candidates:
+                continue
+            for part in chunk.candidates[0].content.parts:
+                if part.function_call:
+                    function_calls.append(part.function_call)
+                elif part.text:
+                    text.append(part.text)
+                    emit({'response': part.text})
+        if not function_calls:
+            return "".join(text)
+        function_responses = []
+        for function_call in function_calls:
+            emit({'tool': function_call.name, 'status': 'running'})
+            function_responses.append(tool_library(function_call))
+            emit({'tool': function_call.name, 'status': 'done'})
+        response = chat.send_message(genai.protos.Content(role="function", parts=function_responses), stream=True)
+
+
+def resync_calendar(user_id, calendar_id):
+    try:
+        calendar_mirror.sync(user_id, calendar_id)
+    except Exception:
+        # The mirror missed a change: stop trusting it until a sync succeeds,
+        # either the watcher's retry or the next read.
+        calendar_mirror.mark_stale(user_id)
+        raise
+
+# Push notifications keep the calendar mirror current. Needs the mirror and a
+# public webhook address (SCIO_CALENDAR_WEBHOOK_URL).
+calendar_watcher = None
+if calendar_mirror is not None:
+    calendar_watcher = create_calendar_watcher(get_calendar_service, resync_calendar, calendar_mirror.set_watched)
+
+
+async def prepare_turn(message, user_id, files):
+    token_refresher.track(user_id)
+    if calendar_watcher is not None:
+        calendar_watcher.track(user_id)
+    # Memory retrieval, the credential load the tools will need and the
+    # attachment uploads don't depend on each other, so they run together
+    # and are joined before the message is sent.
+    memory, _, uploaded_files = await asyncio.gather(
+        recall_memory(message, user_id),
+        run_blocking(prefetch_user_credentials, user_id),
+        upload_files(files),
+    )
+    return memory, uploaded_files
+
+
 @app.post("/chat")
 async def chat_with_scio(message: str = Form(...), user_id: str = Form(...), files: list[UploadFile] = File(None)):
     
@@ -76,53 +190,92 @@ async def chat_with_scio(message: str = Form(...), user_id: str = Form(...), fil
     try:
         
         print(message)
-        UserContext.set_user_id(user_id)
-        memory = search_memory(message, user_id)
+        memory, uploaded_files = await prepare_turn(message, user_id, files)
         print(memory)
-        persona = scio_persona(memory)
-        print(persona)
-        model = genai.GenerativeModel(model_name='gemini-1.5-flash-002', tools=tool_functions, system_instruction=persona)
-        chat = model.start_chat(enable_automatic_function_calling=True)
-        print("model init")
-
-        uploaded_files = []
-        if files:
-            for file in files:
-                # Save the uploaded file temporarily
-                temp_file_path = f"temp_{file.filename}"
-                with open(temp_file_path, "wb") as buffer:
-                    buffer.write(await file.read())
-                # Upload the file to Gemini
-                uploaded_file = genai.upload_file(temp_file_path)
-                uploaded_files.append(uploaded_file)
-                os.remove(temp_file_path)  # Clean up the temporary file
         # Prepare the message for Gemini
         if uploaded_files:
             message_args = []
             for i in range(len(uploaded_files)):
                 message_args.append(uploaded_files[i])
             message_args.append(message)
-            response = chat.send_message(message_args)
+            response_text = await run_for_user(user_id, generate_reply, memory, message_args)
             uploaded_files.clear()
         else:
-            messages = f"User message: {message}    Notes:  - Always use the appropriate function to perform actions. Do not claim to have done something without actually calling the function. If a function is available for a specific task, use it instead of providing information from your training data.  - Avoid displaying any sensitive information like function name to me, keep it to yourself and avoid unnecessary followup questions and KEEP YOUR RESPONSE IT AS CONCISE AS POSSIBLE  "
-            user = {"role": "user", "content": messages}
-            history.append(user)
-            response = chat.send_message(messages)
-            assistant = {"role": "assistant", "content": response.text}
-            history.append(assistant)
-            print(history)
-            add_memory(history, user_id)
+            messages = f"User message: {message}{CHAT_NOTES}"
+            response_text = await run_for_user(user_id, generate_reply, memory, messages)
+            # Only the new turn goes to mem0; earlier turns were already sent.
+            turn = sessions.add_turn(user_id, [
+                {"role": "user", "content": messages},
+                {"role": "assistant", "content": response_text},
+            ])
+            memory_queue.put(user_id, turn)
             print("response here")
         return JSONResponse(content={
-            "content": response.text
+            "content": response_text
         })
+    except HTTPException as e:
+        return JSONResponse(content={
+            "success": False,
+            "error": e.detail
+        }, status_code=e.status_code)
     except Exception as e:
         return JSONResponse(content={
             "success": False,
             "error": str(e)
         }, status_code=500)
 
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_with_scio_stream(message: str = Form(...), user_id: str = Form(...), files: list[UploadFile] = File(None)):
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def emit(event):
+        # Called from the worker thread running the Gemini turn.
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def run_turn(memory, contents):
+        try:
+            return stream_reply(memory, contents, emit)
+        finally:
+            emit(None)
+
+    async def event_stream():
+        # Send something straight away so the client gets its first byte
+        # before memory search and uploads have finished.
+        yield sse_event({'status': 'thinking'})
+        try:
+            memory, uploaded_files = await prepare_turn(message, user_id, files)
+            if uploaded_files:
+                contents = [*uploaded_files, message]
+            else:
+                contents = f"User message: {message}{CHAT_NOTES}"
+            turn = asyncio.ensure_future(run_for_user(user_id, run_turn, memory, contents))
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield sse_event(event)
+            response_text = await turn
+            if not uploaded_files:
+                turn = sessions.add_turn(user_id, [
+                    {"role": "user", "content": contents},
+                    {"role": "assistant", "content": response_text},
+                ])
+                memory_queue.put(user_id, turn)
+        except HTTPException as e:
+            yield sse_event({'success': False, 'error': e.detail})
+        except Exception as e:
+            yield sse_event({'success': False, 'error': str(e)})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.post("/get_schedule")
 async def get_schedule():
     try:
@@ -142,12 +295,34 @@ async def get_schedule():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def stream_response(response_text):
-    chunk_size = 100  # Adjust this value as needed
-    for i in range(0, len(response_text), chunk_size):
-        chunk = response_text[i:i+chunk_size]
-        yield f"data: {json.dumps({'response': chunk})}\n\n"
-    yield "data: [DONE]\n\n"
+class GroupFreeTimeRequest(BaseModel):
+    user_ids: list[str]
+    start_date: str
+    end_date: str
+    duration_minutes: int = 60
+    study_hours: dict = {"start": 9, "end": 21}
+    timezone: str = None
+    max_results: int = 5
+
+@app.post("/group_free_time")
+async def group_free_time(group: GroupFreeTimeRequest):
+    user_ids = list(dict.fromkeys(group.user_ids))
+    if not user_ids or len(user_ids) > GROUP_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {GROUP_MAX_USERS} user IDs")
+    try:
+        start_date = datetime.strptime(group.start_date, "%Y-%m-%d").date()
+        end_date = datetime.strptime(group.end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+    result = await run_blocking(
+        find_group_free_slots, user_ids, start_date, end_date, group.study_hours,
+        group.duration_minutes, group.timezone, group.max_results,
+    )
+    return {
+        "slots": [{"start": slot["start"].isoformat(), "end": slot["end"].isoformat()} for slot in result["slots"]],
+        "unavailable": result["unavailable"],
+    }
+
 
 @app.get("/")
 async def root():
@@ -169,6 +344,11 @@ async def oauth2callback(request: Request):
 
     credentials = flow.credentials
     user, custom_token = login_redirect(credentials)
+    invalidate_services(user.uid)
+    if calendar_mirror is not None:
+        calendar_mirror.invalidate(user.uid)
+    if tasks_mirror is not None:
+        tasks_mirror.invalidate(user.uid)
     
     # Redirect to the frontend's OAuth callback route with the tokens
     frontend_callback_url = "https://scio-planning.vercel.app/oauth-callback"
@@ -206,6 +386,51 @@ async def save_chat(chat_data: dict):
 
 
 
+@app.post("/calendar/notifications")
+async def calendar_notifications(request: Request):
+    if calendar_watcher is None:
+        raise HTTPException(status_code=404, detail="Calendar notifications are not enabled")
+    status = calendar_watcher.notify(
+        request.headers.get("X-Goog-Channel-ID"),
+        request.headers.get("X-Goog-Resource-ID"),
+        request.headers.get("X-Goog-Channel-Token"),
+        request.headers.get("X-Goog-Resource-State"),
+    )
+    return Response(status_code=status)
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "memory_cache": memory_cache_stats(),
+        "credential_cache": credential_cache.stats(),
+        "memory_queue": memory_queue.stats(),
+        "service_cache": service_cache.stats(),
+        "token_refresh": {**token_refresher.stats(), **refresh_counts},
+        "sessions": sessions.stats(),
+        "upload_cache": upload_cache.stats(),
+        "calendar_mirror": calendar_mirror_stats(),
+        "tasks_mirror": tasks_mirror_stats(),
+        "calendar_watch": calendar_watcher.stats() if calendar_watcher is not None else None,
+    }
+
+
+@app.on_event("startup")
+def startup():
+    memory_queue.start()
+    token_refresher.start()
+    if calendar_watcher is not None:
+        calendar_watcher.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    memory_queue.stop()
+    token_refresher.stop()
+    if calendar_watcher is not None:
+        calendar_watcher.stop()
+    shutdown_executor()
+    shutdown_credentials()
 
 
 if __name__ == "__main__":
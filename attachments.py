@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+import google.generativeai as genai
+from utils.concurrency import run_blocking, run_in_process
+from utils.preprocess import can_preprocess, preprocess_file
+
+CHUNK_SIZE = 1024 * 1024
+# Total size of all attachments in one request.
+MAX_UPLOAD_BYTES = int(os.environ.get("SCIO_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+# Gemini uploads in flight at once across all requests of this worker.
+UPLOAD_CONCURRENCY = int(os.environ.get("SCIO_UPLOAD_CONCURRENCY", 4))
+
+upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+# Optional local preprocessing before upload: large images are downscaled and
+# text-based PDFs are sent as plain text. Runs in the process pool.
+PREPROCESS = os.environ.get("SCIO_PREPROCESS_ATTACHMENTS", "1") == "1"
+PREPROCESS_MIN_BYTES = int(os.environ.get("SCIO_PREPROCESS_MIN_BYTES", 256 * 1024))
+IMAGE_MAX_SIDE = int(os.environ.get("SCIO_IMAGE_MAX_SIDE", 2048))
+IMAGE_QUALITY = int(os.environ.get("SCIO_IMAGE_QUALITY", 85))
+PDF_MIN_CHARS_PER_PAGE = int(os.environ.get("SCIO_PDF_MIN_CHARS_PER_PAGE", 200))
+
+# Gemini deletes uploaded files after 48 hours. Handles are dropped from the
+# cache this long before the remote expiry so a cached handle is never dead.
+FILE_RETENTION = timedelta(hours=48)
+EXPIRY_MARGIN = timedelta(seconds=int(os.environ.get("SCIO_UPLOAD_CACHE_MARGIN_SECONDS", 3600)))
+
+
+class UploadCache:
+    """
+    Maps the SHA-256 of an attachment's bytes to the Gemini file handle it was
+    uploaded as, so sending the same file again skips the upload. Bounded by
+    entry count and by the total size of the files it refers to.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=2 * 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _drop(self, digest):
+        _, size, _ = self._entries.pop(digest)
+        self._bytes -= size
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                handle, size, expires_at = entry
+                if expires_at > datetime.now(timezone.utc):
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    self.bytes_saved += size
+                    return handle
+                self._drop(digest)
+            self.misses += 1
+            return None
+
+    def put(self, digest, handle, size):
+        expires_at = getattr(handle, 'expiration_time', None) or datetime.now(timezone.utc) + FILE_RETENTION
+        expires_at -= EXPIRY_MARGIN
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (handle, size, expires_at)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+            }
+
+
+upload_cache = UploadCache(
+    max_entries=int(os.environ.get("SCIO_UPLOAD_CACHE_ENTRIES", 512)),
+    max_bytes=int(os.environ.get("SCIO_UPLOAD_CACHE_BYTES", 2 * 1024 * 1024 * 1024)),
+)
+
+
+class Attachment:
+    def __init__(self, file):
+        self.file = file
+        self.filename = os.path.basename(file.filename or "attachment")
+        self.mime_type = file.content_type
+        if not self.mime_type or self.mime_type == "application/octet-stream":
+            self.mime_type = mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        self.size = 0
+        self.digest = None
+        self.processed_path = None
+
+
+def measure(attachment):
+    # Reads the spooled upload in chunks, never holding the whole file.
+    stream = attachment.file.file
+    stream.seek(0)
+    size = 0
+    digest = hashlib.sha256()
+    while chunk := stream.read(CHUNK_SIZE):
+        size += len(chunk)
+        digest.update(chunk)
+    stream.seek(0)
+    attachment.size = size
+    attachment.digest = digest.hexdigest()
+    return attachment
+
+
+def spool(attachment):
+    stream = attachment.file.file
+    stream.seek(0)
+    fd, path = tempfile.mkstemp(prefix="scio_", suffix=os.path.splitext(attachment.filename)[1])
+    with os.fdopen(fd, "wb") as buffer:
+        shutil.copyfileobj(stream, buffer, CHUNK_SIZE)
+    return path
+
+
+async def preprocess(attachment):
+    # Returns the text to send in place of the file, or None. A smaller
+    # replacement file is recorded on the attachment for upload.
+    if not PREPROCESS or attachment.size < PREPROCESS_MIN_BYTES or not can_preprocess(attachment.mime_type):
+        return None
+    path = await run_blocking(spool, attachment)
+    try:
+        result = await run_in_process(preprocess_file, path, attachment.mime_type, IMAGE_MAX_SIDE, IMAGE_QUALITY, PDF_MIN_CHARS_PER_PAGE)
+    finally:
+        os.remove(path)
+    if result is None:
+        return None
+    if "text" in result:
+        return f"Contents of attached file {attachment.filename}:\n{result['text']}"
+    attachment.processed_path = result["path"]
+    attachment.mime_type = result["mime_type"]
+    return None
+
+
+def upload(attachment):
+    if attachment.processed_path:
+        try:
+            return genai.upload_file(attachment.processed_path, mime_type=attachment.mime_type, display_name=attachment.filename)
+        finally:
+            os.remove(attachment.processed_path)
+    stream = attachment.file.file
+    stream.seek(0)
+    # The request body is already spooled by the framework, so the buffer is
+    # handed to Gemini as is. Only streams the SDK can't take directly are
+    # copied to a private temp file first.
+    if isinstance(stream, io.IOBase):
+        return genai.upload_file(stream, mime_type=attachment.mime_type, display_name=attachment.filename)
+    suffix = os.path.splitext(attachment.filename)[1]
+    with tempfile.NamedTemporaryFile(prefix="scio_", suffix=suffix) as buffer:
+        shutil.copyfileobj(stream, buffer, CHUNK_SIZE)
+        buffer.flush()
+        return genai.upload_file(buffer.name, mime_type=attachment.mime_type, display_name=attachment.filename)
+
+
+async def upload_limited(attachment):
+    # The "handle" is the Gemini file, or the extracted text of a PDF; either
+    # can be passed to send_message and both are cached by content hash.
+    handle = await preprocess(attachment)
+    if handle is None:
+        async with upload_slots:
+            handle = await run_blocking(upload, attachment)
+    upload_cache.put(attachment.digest, handle, attachment.size)
+    return handle
+
+
+async def upload_files(files):
+    if not files:
+        return []
+    attachments = await asyncio.gather(*[run_blocking(measure, Attachment(file)) for file in files])
+    total = sum(attachment.size for attachment in attachments)
+    if total > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Attachments are too large ({total} bytes, limit {MAX_UPLOAD_BYTES}).")
+    handles = {}
+    pending = {}
+    for attachment in attachments:
+        if attachment.digest in handles or attachment.digest in pending:
+            continue
+        handle = upload_cache.get(attachment.digest)
+        if handle is not None:
+            handles[attachment.digest] = handle
+        else:
+            pending[attachment.digest] = attachment
+    uploaded = await asyncio.gather(*[upload_limited(attachment) for attachment in pending.values()])
+    handles.update(zip(pending, uploaded))
+    return [handles[attachment.digest] for attachment in attachments]
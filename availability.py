@@ -0,0 +1,193 @@
+import heapq
+import os
+from datetime import datetime, timedelta
+from math import ceil, floor
+
+# NumPy is optional; without it the interval sweep is always used.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Availability is computed on plain (start, end) tuples of POSIX timestamps,
+# converted from and to datetimes only at the edges.
+
+# "intervals" (sweep line), "bitmap" (NumPy) or "auto": the bitmap once there
+# are enough busy periods (thousands, e.g. group queries over many calendars)
+# for the vectorized version to beat the sweep.
+BACKEND = os.environ.get("SCIO_AVAILABILITY_BACKEND", "auto")
+BITMAP_THRESHOLD = int(os.environ.get("SCIO_AVAILABILITY_BITMAP_THRESHOLD", 5000))
+
+
+def to_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value.timestamp()
+
+
+def preferred_windows(start_date, end_date, preferred_hours, tz):
+    """
+    One (start, end) window per day from start_date to end_date inclusive,
+    covering the preferred hours in the given pytz timezone.
+    """
+    windows = []
+    current_date = start_date
+    while current_date <= end_date:
+        day_start = datetime.combine(current_date, datetime.min.time())
+        window_start = tz.localize(day_start + timedelta(hours=preferred_hours['start'])).timestamp()
+        window_end = tz.localize(day_start + timedelta(hours=preferred_hours['end'])).timestamp()
+        if window_start < window_end:
+            windows.append((window_start, window_end))
+        current_date += timedelta(days=1)
+    return windows
+
+
+def merge_intervals(intervals):
+    """
+    Sweep over intervals sorted by start, merging overlapping or touching
+    ones. Returns a sorted list of disjoint intervals.
+    """
+    return merge_sorted(sorted(intervals))
+
+
+def merge_sorted(intervals):
+    # merge_intervals for input that is already sorted by start.
+    merged = []
+    for start, end in intervals:
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_intervals(busy, windows, min_duration=0):
+    """
+    The parts of `windows` not covered by `busy`. Both must be sorted and
+    disjoint (see merge_intervals); a single pass walks both lists.
+    """
+    free = []
+    i = 0
+    for window_start, window_end in windows:
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        current = window_start
+        j = i
+        while j < len(busy) and busy[j][0] < window_end:
+            busy_start, busy_end = busy[j]
+            if busy_start > current:
+                free.append((current, busy_start))
+            current = max(current, busy_end)
+            j += 1
+        if current < window_end:
+            free.append((current, window_end))
+    if min_duration:
+        free = [(start, end) for start, end in free if end - start >= min_duration]
+    return free
+
+
+class BusyBitmap:
+    """
+    Availability over a horizon with one cell per `resolution` seconds (a
+    minute by default). Busy intervals from any number of calendars are
+    rasterized as +1/-1 edges in one vectorized pass, and a single cumulative
+    sum over the edges gives each cell's busy count. Partially covered cells
+    count as busy.
+    """
+
+    def __init__(self, start, end, resolution=60):
+        self.resolution = resolution
+        self.origin = floor(start / resolution) * resolution
+        self.length = max(0, ceil((end - self.origin) / resolution))
+        self.edges = np.zeros(self.length + 1, dtype=np.int64)
+        self.busy_count = 0
+
+    def _edges(self, intervals, outward):
+        if not len(intervals):
+            return np.zeros(self.length + 1, dtype=np.int64)
+        bounds = (np.asarray(intervals, dtype=np.float64) - self.origin) / self.resolution
+        starts = np.floor(bounds[:, 0]) if outward else np.ceil(bounds[:, 0])
+        ends = np.ceil(bounds[:, 1]) if outward else np.floor(bounds[:, 1])
+        starts = np.clip(starts, 0, self.length).astype(np.int64)
+        ends = np.clip(ends, 0, self.length).astype(np.int64)
+        keep = starts < ends
+        size = self.length + 1
+        return np.bincount(starts[keep], minlength=size) - np.bincount(ends[keep], minlength=size)
+
+    def add_busy(self, intervals):
+        self.edges += self._edges(intervals, outward=True)
+        self.busy_count += len(intervals)
+
+    def free_mask(self, windows=None):
+        if windows is None:
+            return np.cumsum(self.edges[:-1]) == 0
+        # Weight the (disjoint) windows above any possible busy count, so a
+        # cell is free exactly when its sum equals one window's weight.
+        weight = self.busy_count + 1
+        return np.cumsum(self.edges[:-1] + weight * self._edges(windows, outward=False)[:-1]) == weight
+
+    def _runs(self, mask):
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    def free_runs(self, windows=None, min_duration=0):
+        starts, ends = self._runs(self.free_mask(windows))
+        if min_duration:
+            keep = (ends - starts) * self.resolution >= min_duration
+            starts, ends = starts[keep], ends[keep]
+        origin, resolution = self.origin, self.resolution
+        return [(origin + int(start) * resolution, origin + int(end) * resolution) for start, end in zip(starts, ends)]
+
+    def largest_free_block(self, windows=None):
+        starts, ends = self._runs(self.free_mask(windows))
+        if not len(starts):
+            return None
+        best = int(np.argmax(ends - starts))
+        return self.origin + int(starts[best]) * self.resolution, self.origin + int(ends[best]) * self.resolution
+
+
+def use_bitmap(busy_count):
+    if np is None or BACKEND == "intervals":
+        return False
+    return BACKEND == "bitmap" or busy_count >= BITMAP_THRESHOLD
+
+
+def find_free(busy, windows, min_duration=0):
+    """
+    Free parts of `windows` (sorted, disjoint) given unmerged busy intervals
+    from any number of calendars, using the backend chosen by use_bitmap.
+    """
+    if not windows:
+        return []
+    if use_bitmap(len(busy)):
+        bitmap = BusyBitmap(windows[0][0], windows[-1][1])
+        bitmap.add_busy(busy)
+        return bitmap.free_runs(windows, min_duration)
+    return free_intervals(merge_intervals(busy), windows, min_duration)
+
+
+def common_free(busy_by_user, windows, min_duration=0):
+    """
+    Free parts of `windows` shared by every user, given each user's unmerged
+    busy intervals. Each user's busy list is merged on its own, then the k
+    sorted lists are combined with a heap-based k-way merge and swept once:
+    O(n log k) for n busy periods across k users.
+    """
+    if not windows:
+        return []
+    if use_bitmap(sum(len(busy) for busy in busy_by_user)):
+        bitmap = BusyBitmap(windows[0][0], windows[-1][1])
+        for busy in busy_by_user:
+            bitmap.add_busy(busy)
+        return bitmap.free_runs(windows, min_duration)
+    busy = merge_sorted(heapq.merge(*(merge_intervals(busy) for busy in busy_by_user)))
+    return free_intervals(busy, windows, min_duration)
+
+
+def rank_slots(slots, limit=None):
+    # Longest slots first, earlier ones first among equally long slots.
+    ranked = sorted(slots, key=lambda slot: (slot[0] - slot[1], slot[0]))
+    return ranked if limit is None else ranked[:limit]
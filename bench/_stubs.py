@@ -0,0 +1,19 @@
+# google_auth, plan_tools and app reach Firebase, the OAuth client secrets and
+# mem0 at import time. The benchmarks never talk to them, so they are stubbed
+# before anything from the repository is imported.
+import os
+import sys
+import types
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+firebase_config = types.ModuleType('firebase_config')
+firebase_config.db = mock.MagicMock()
+sys.modules.setdefault('firebase_config', firebase_config)
+
+import google_auth_oauthlib.flow
+import mem0
+
+google_auth_oauthlib.flow.Flow.from_client_secrets_file = mock.MagicMock()
+mem0.MemoryClient = mock.MagicMock()
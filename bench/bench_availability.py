@@ -0,0 +1,47 @@
+"""
+Compares the two free-time backends, the interval sweep and the NumPy
+BusyBitmap, on 30 days of 8:00-22:00 windows at increasing event counts.
+The crossover is what SCIO_AVAILABILITY_BITMAP_THRESHOLD is set from.
+
+Run from the repository root: python bench/bench_availability.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from availability import BusyBitmap, free_intervals, merge_intervals
+
+DAY = 86400
+WINDOWS = [(day * DAY + 8 * 3600, day * DAY + 22 * 3600) for day in range(30)]
+SIZES = (10, 100, 1000, 5000, 10000, 50000)
+
+
+def with_intervals(busy):
+    return free_intervals(merge_intervals(busy), WINDOWS, 1800)
+
+
+def with_bitmap(busy):
+    bitmap = BusyBitmap(WINDOWS[0][0], WINDOWS[-1][1])
+    bitmap.add_busy(busy)
+    return bitmap.free_runs(WINDOWS, 1800)
+
+
+def main():
+    for size in SIZES:
+        random.seed(size)
+        busy = []
+        for _ in range(size):
+            start = random.randrange(0, 30 * DAY, 60)
+            busy.append((start, start + random.choice([1800, 3600, 5400])))
+        assert len(with_intervals(busy)) == len(with_bitmap(busy))
+        runs = max(20, 20000 // size)
+        intervals = timeit.timeit(lambda: with_intervals(busy), number=runs) / runs
+        bitmap = timeit.timeit(lambda: with_bitmap(busy), number=runs) / runs
+        print(f"{size:>6} events: intervals {intervals * 1e6:8.0f} us  bitmap {bitmap * 1e6:8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
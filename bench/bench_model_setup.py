@@ -0,0 +1,29 @@
+"""
+Cost of setting up the Gemini model for one chat turn: building a
+GenerativeModel from the tool functions (declarations derived from their
+signatures every time) against build_model, which reuses the prepared tool
+library.
+
+Run from the repository root: python bench/bench_model_setup.py
+"""
+import timeit
+
+import _stubs  # noqa: F401
+import google.generativeai as genai
+import app
+from utils.persona import scio_persona
+
+RUNS = 200
+
+
+def main():
+    rebuilt = timeit.timeit(
+        lambda: genai.GenerativeModel(model_name=app.MODEL_NAME, tools=app.tool_functions, system_instruction=scio_persona("memory")),
+        number=RUNS,
+    ) / RUNS
+    reused = timeit.timeit(lambda: app.build_model("memory"), number=RUNS) / RUNS
+    print(f"rebuilt tools {rebuilt * 1e3:.2f} ms  build_model {reused * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Bytes and calls needed to read a calendar through iter_items, against a fake
+events().list() that serves realistic event resources and honours fields=:
+every whole resource, every projected item, and the first 10 projected items.
+
+Run from the repository root: python bench/bench_paging.py
+"""
+import json
+import re
+
+import _stubs  # noqa: F401
+from google_services import iter_items
+
+SIZES = (1000, 10000)
+
+
+def project(item, fields):
+    keep = [field.split('(')[0] for field in re.split(r',(?![^(]*\))', fields)]
+    return {key: value for key, value in item.items() if key in keep}
+
+
+def fake_event(i):
+    return {
+        'id': f"e{i}", 'kind': 'calendar#event', 'etag': '"3181"', 'status': 'confirmed',
+        'htmlLink': 'https://www.google.com/calendar/event?eid=' + 'x' * 60,
+        'created': '2024-01-01T00:00:00.000Z', 'updated': '2024-01-01T00:00:00.000Z',
+        'summary': f"Lecture {i}", 'description': 'Lorem ipsum ' * 40, 'location': 'Room 101',
+        'creator': {'email': 'a@b.c', 'self': True}, 'organizer': {'email': 'a@b.c', 'self': True},
+        'start': {'dateTime': '2026-10-19T10:00:00Z', 'timeZone': 'UTC'},
+        'end': {'dateTime': '2026-10-19T11:00:00Z', 'timeZone': 'UTC'},
+        'iCalUID': 'x' * 40 + '@google.com', 'sequence': 0,
+        'attendees': [{'email': f"p{j}@x.y", 'responseStatus': 'accepted'} for j in range(8)],
+        'reminders': {'useDefault': True}, 'eventType': 'default',
+    }
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeList:
+    # Stands in for service.events().list, counting response bytes and calls.
+
+    def __init__(self, count):
+        self.items = [fake_event(i) for i in range(count)]
+        self.bytes = 0
+        self.calls = 0
+
+    def __call__(self, pageToken=None, maxResults=250, fields=None, **params):
+        start = int(pageToken or 0)
+        page = self.items[start:start + maxResults]
+        if fields:
+            item_fields = re.search(r'items\((.*)\)', fields).group(1)
+            page = [project(item, item_fields) for item in page]
+        response = {'items': page}
+        if start + maxResults < len(self.items):
+            response['nextPageToken'] = str(start + maxResults)
+        self.bytes += len(json.dumps(response))
+        self.calls += 1
+        return FakeRequest(response)
+
+
+def whole_resources(list_method):
+    # What the tools did before: every page, every field.
+    items, page_token = [], None
+    while True:
+        response = list_method(pageToken=page_token).execute()
+        items += response['items']
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return items
+
+
+def main():
+    for size in SIZES:
+        runs = [
+            ("whole resources", lambda list_method: whole_resources(list_method)),
+            ("projected", lambda list_method: list(iter_items(list_method, "id,summary,start,end", page_size=250))),
+            ("first 10 projected", lambda list_method: list(iter_items(list_method, "id,summary,start,end", limit=10, page_size=250))),
+        ]
+        for name, read in runs:
+            list_method = FakeList(size)
+            read(list_method)
+            print(f"{size:>6} events, {name:<18} {list_method.bytes / 1e3:>9.1f} KB over {list_method.calls} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Cost of getting a Calendar service for a tool call: googleapiclient's build()
+as the tools used to call it, get_service on a cold cache (built from the
+parsed discovery document) and get_service on a cache hit.
+
+Run from the repository root: python bench/bench_services.py
+"""
+import timeit
+from datetime import datetime, timedelta
+
+import _stubs  # noqa: F401
+import google_services
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+RUNS = 50
+
+
+def main():
+    credentials = Credentials('token', expiry=datetime.utcnow() + timedelta(minutes=50))
+    google_services.get_credentials = lambda user_id: credentials
+
+    built = timeit.timeit(lambda: build('calendar', 'v3', credentials=credentials), number=RUNS) / RUNS
+    google_services.discovery_document('calendar', 'v3')
+
+    def cold():
+        google_services.service_cache.clear()
+        return google_services.get_service('calendar', 'v3', 'user')
+
+    miss = timeit.timeit(cold, number=RUNS) / RUNS
+    hit = timeit.timeit(lambda: google_services.get_service('calendar', 'v3', 'user'), number=RUNS * 100) / (RUNS * 100)
+    print(f"build() {built * 1e3:.2f} ms  cache miss {miss * 1e3:.2f} ms  cache hit {hit * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
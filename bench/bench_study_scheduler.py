@@ -0,0 +1,48 @@
+"""
+Times plan_study_sessions on a synthetic calendar: 500 tasks over 120 days of
+8:00-22:00 windows with 3000 random 15-60 minute events and three reviews per task.
+
+Run from the repository root: python bench/bench_study_scheduler.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from availability import free_intervals, merge_intervals
+from study_scheduler import StudyTask, plan_study_sessions
+
+DAY = 86400
+DAYS = 120
+EVENTS = 3000
+TASKS = 500
+RUNS = 20
+
+
+def synthetic_calendar(seed=0):
+    random.seed(seed)
+    windows = [(day * DAY + 8 * 3600, day * DAY + 22 * 3600) for day in range(DAYS)]
+    busy = []
+    for _ in range(EVENTS):
+        start = random.choice(windows)[0] + random.randrange(0, 14 * 3600, 900)
+        busy.append((start, start + random.choice([900, 1800, 3600])))
+    free = free_intervals(merge_intervals(busy), windows, 1800)
+    tasks = [
+        StudyTask(f"Task {i}", random.randrange(7, DAYS) * DAY, random.choice([1800, 3600, 5400, 7200]), random.randrange(3))
+        for i in range(TASKS)
+    ]
+    return tasks, free, windows
+
+
+def main():
+    tasks, free, windows = synthetic_calendar()
+    sessions, unscheduled = plan_study_sessions(tasks, free, windows, 0, review_offsets=(1, 3, 7))
+    seconds = timeit.timeit(lambda: plan_study_sessions(tasks, free, windows, 0, review_offsets=(1, 3, 7)), number=RUNS) / RUNS
+    print(f"{TASKS} tasks, {EVENTS} events, {len(free)} free slots over {DAYS} days")
+    print(f"{len(sessions)} sessions, {len(unscheduled)} unscheduled, {seconds * 1e3:.1f} ms per plan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+import pytz
+from googleapiclient.errors import HttpError
+from availability import to_timestamp
+from google_services import iter_pages
+from utils.cache import TTLCache
+from utils.concurrency import LockStripes
+
+# Only the fields the tools and free-slot computation read are fetched and kept.
+EVENT_FIELDS = "id,status,summary,description,location,start,end,transparency,etag,htmlLink,attendees(self,responseStatus)"
+LIST_FIELDS = f"nextPageToken,nextSyncToken,timeZone,items({EVENT_FIELDS})"
+_KEEP = ('id', 'summary', 'description', 'location', 'start', 'end', 'transparency', 'etag', 'htmlLink')
+
+
+class EventStore:
+    """
+    Mirror of one calendar: the events by ID plus a start-time index, the sync
+    token to resume from and the time range the mirror is complete for.
+    """
+
+    def __init__(self, time_zone='UTC', covered_from=None):
+        self.events = {}
+        self.starts = []
+        self.time_zone = time_zone
+        self.covered_from = covered_from
+        self.sync_token = None
+        self.synced_at = float('-inf')
+        self.longest = 0.0
+
+    def _times(self, event):
+        tz = pytz.timezone(self.time_zone)
+        times = []
+        for key in ('start', 'end'):
+            value = event.get(key, {})
+            if 'dateTime' in value:
+                times.append(to_timestamp(value['dateTime']))
+            else:
+                day = datetime.strptime(value['date'], "%Y-%m-%d")
+                times.append(tz.localize(day).timestamp())
+        return times
+
+    def remove(self, event_id):
+        event = self.events.pop(event_id, None)
+        if event is not None:
+            key = (event['start_ts'], event_id)
+            self.starts.pop(bisect_left(self.starts, key))
+
+    def apply(self, event):
+        self.remove(event['id'])
+        if event.get('status') == 'cancelled':
+            return
+        declined = any(
+            attendee.get('self') and attendee.get('responseStatus') == 'declined'
+            for attendee in event.get('attendees', [])
+        )
+        compact = {key: event[key] for key in _KEEP if key in event}
+        compact['start_ts'], compact['end_ts'] = self._times(event)
+        compact['busy'] = event.get('transparency') != 'transparent' and not declined
+        self.events[event['id']] = compact
+        insort(self.starts, (compact['start_ts'], event['id']))
+        self.longest = max(self.longest, compact['end_ts'] - compact['start_ts'])
+
+    def between(self, start, end=float('inf')):
+        # Events overlapping [start, end), by start time. Only events starting
+        # at most `longest` seconds before `start` can still be running.
+        lo = bisect_left(self.starts, (start - self.longest,))
+        hi = bisect_right(self.starts, (end,))
+        return [
+            self.events[event_id] for _, event_id in self.starts[lo:hi]
+            if self.events[event_id]['end_ts'] > start and self.events[event_id]['start_ts'] < end
+        ]
+
+
+class CalendarMirror:
+    """
+    Per-user, per-calendar local copy of Google Calendar events kept current
+    with sync tokens.
+
+    The first read of a calendar lists its events from `lookback_days` ago
+    onwards. Later reads of a mirror older than `max_age` seconds send only the
+    returned sync token and apply the changes. A 410 Gone (expired token)
+    drops the mirror and starts over with a full sync. `service_for(user_id)`
+    returns the Calendar service to use, so a fake API can be plugged in.
+
+    Calendars with a push-notification channel (see set_watched) are re-synced
+    when they change, so their mirror is trusted for `watched_max_age`.
+    """
+
+    def __init__(self, service_for, max_age=60, lookback_days=30, max_calendars=2048, idle_ttl=3600,
+                 watched_max_age=3600):
+        self.service_for = service_for
+        self.max_age = max_age
+        self.watched_max_age = watched_max_age
+        self._watched = set()
+        self.lookback = timedelta(days=lookback_days)
+        self._stores = TTLCache(maxsize=max_calendars, ttl=idle_ttl)
+        self._lock = LockStripes()
+        self._stats = {'full_syncs': 0, 'incremental_syncs': 0, 'resets': 0, 'changes': 0}
+
+    def _list(self, service, calendar_id, **params):
+        return iter_pages(service.events().list, LIST_FIELDS, calendarId=calendar_id, singleEvents=True, showDeleted=True, **params)
+
+    def _full_sync(self, service, calendar_id):
+        covered_from = datetime.now(pytz.UTC) - self.lookback
+        store = EventStore(covered_from=covered_from.timestamp())
+        for page in self._list(service, calendar_id, timeMin=covered_from.isoformat()):
+            store.time_zone = page.get('timeZone', store.time_zone)
+            for event in page.get('items', []):
+                store.apply(event)
+            store.sync_token = page.get('nextSyncToken', store.sync_token)
+        self._stats['full_syncs'] += 1
+        return store
+
+    def _incremental_sync(self, service, calendar_id, store):
+        sync_token = store.sync_token
+        for page in self._list(service, calendar_id, syncToken=sync_token):
+            for event in page.get('items', []):
+                store.apply(event)
+                self._stats['changes'] += 1
+            sync_token = page.get('nextSyncToken', sync_token)
+        store.sync_token = sync_token
+        self._stats['incremental_syncs'] += 1
+
+    def sync(self, user_id, calendar_id='primary', max_age=None):
+        # With max_age, a mirror synced that recently (e.g. by another thread
+        # while this one waited for the lock) is returned as is.
+        key = (user_id, calendar_id)
+        with self._lock(key):
+            store = self._stores.get(key)
+            if store is not None and max_age is not None and time.monotonic() - store.synced_at <= max_age:
+                return store
+            service = self.service_for(user_id)
+            if store is not None and store.sync_token:
+                try:
+                    self._incremental_sync(service, calendar_id, store)
+                except HttpError as error:
+                    if error.resp.status != 410:
+                        raise
+                    self._stats['resets'] += 1
+                    store = None
+            else:
+                store = None
+            if store is None:
+                store = self._full_sync(service, calendar_id)
+            store.synced_at = time.monotonic()
+            self._stores.set(key, store)
+            return store
+
+    def _max_age(self, key):
+        return self.watched_max_age if key in self._watched else self.max_age
+
+    def _fresh(self, key):
+        # The calendar's mirror if it was synced within its max age, else None.
+        store = self._stores.peek(key)
+        if store is not None and store.sync_token and time.monotonic() - store.synced_at <= self._max_age(key):
+            return store
+        return None
+
+    def store(self, user_id, calendar_id='primary'):
+        # The calendar's mirror, synced first if it is older than max_age.
+        key = (user_id, calendar_id)
+        store = self._fresh(key)
+        if store is not None:
+            return store
+        return self.sync(user_id, calendar_id, self._max_age(key))
+
+    def set_watched(self, user_id, calendar_id, watched):
+        if watched:
+            self._watched.add((user_id, calendar_id))
+        else:
+            self._watched.discard((user_id, calendar_id))
+
+    def events(self, user_id, start, end=float('inf'), calendar_id='primary'):
+        """
+        Events of the calendar overlapping [start, end) (timestamps), sorted
+        by start, or None if the mirror doesn't cover `start`.
+        """
+        store = self.store(user_id, calendar_id)
+        if store.covered_from is not None and start < store.covered_from:
+            return None
+        with self._lock((user_id, calendar_id)):
+            return store.between(start, end)
+
+    def busy_intervals(self, user_id, calendar_ids, start, end):
+        """
+        Busy (start, end) timestamps of the given calendars, as free/busy would
+        report them, or None unless every calendar already has a fresh mirror
+        covering `start`. Never syncs: a single free/busy query is cheaper
+        than bringing several calendars up to date.
+        """
+        busy = []
+        for calendar_id in calendar_ids:
+            key = (user_id, calendar_id)
+            store = self._fresh(key)
+            if store is None or (store.covered_from is not None and start < store.covered_from):
+                return None
+            with self._lock(key):
+                events = store.between(start, end)
+            busy.extend((event['start_ts'], event['end_ts']) for event in events if event['busy'])
+        return busy
+
+    def event(self, user_id, event_id, calendar_id='primary'):
+        # The mirrored copy of one event if the calendar is mirrored, without syncing.
+        store = self._stores.peek((user_id, calendar_id))
+        return None if store is None else store.events.get(event_id)
+
+    def apply(self, user_id, event, calendar_id='primary'):
+        # Write-through of an event the tools just created or changed.
+        key = (user_id, calendar_id)
+        with self._lock(key):
+            store = self._stores.peek(key)
+            if store is not None and store.sync_token:
+                store.apply(event)
+
+    def remove(self, user_id, event_id, calendar_id='primary'):
+        key = (user_id, calendar_id)
+        with self._lock(key):
+            store = self._stores.peek(key)
+            if store is not None:
+                store.remove(event_id)
+
+    def mark_stale(self, user_id):
+        # The next read of any of the user's calendars syncs first.
+        for key in self._stores.keys():
+            store = self._stores.peek(key) if key[0] == user_id else None
+            if store is not None:
+                store.synced_at = float('-inf')
+
+    def invalidate(self, user_id):
+        self._stores.discard_where(lambda key: key[0] == user_id)
+        self._watched = {key for key in self._watched if key[0] != user_id}
+
+    def stats(self):
+        return {**self._stats, 'calendars': len(self._stores), 'watched': len(self._watched)}
+
+
+def create_calendar_mirror(service_for):
+    if os.environ.get("SCIO_CALENDAR_MIRROR", "1") != "1":
+        return None
+    return CalendarMirror(
+        service_for,
+        max_age=int(os.environ.get("SCIO_CALENDAR_MIRROR_MAX_AGE", 60)),
+        lookback_days=int(os.environ.get("SCIO_CALENDAR_MIRROR_LOOKBACK_DAYS", 30)),
+        watched_max_age=int(os.environ.get("SCIO_CALENDAR_MIRROR_WATCHED_MAX_AGE", 3600)),
+    )
@@ -0,0 +1,223 @@
+import hmac
+import os
+import secrets
+import threading
+import time
+import uuid
+
+
+class Channel:
+    __slots__ = ('id', 'user_id', 'calendar_id', 'resource_id', 'token', 'expires_at')
+
+    def __init__(self, id, user_id, calendar_id, resource_id, token, expires_at):
+        self.id = id
+        self.user_id = user_id
+        self.calendar_id = calendar_id
+        self.resource_id = resource_id
+        self.token = token
+        self.expires_at = expires_at
+
+
+class CalendarWatcher:
+    """
+    Google Calendar push notifications for recently active users.
+
+    `track(user_id)` marks a user active; the background thread then opens an
+    events.watch channel on their primary calendar pointing at `address`,
+    renews it `renew_before` seconds before it expires, and lets it lapse once
+    the user has been inactive for `active_window` seconds.
+
+    `notify` validates a notification's channel headers against the channel
+    it was registered with. Bursts of notifications for a user are coalesced:
+    `on_change(user_id, calendar_id)` runs once, `debounce` seconds after the
+    first of them, and is retried with exponential backoff (up to
+    `max_retry_delay`) if it fails. `on_watch(user_id, calendar_id, watched)`
+    reports channels opening and closing.
+
+    Channels are kept in this process's memory, so notifications only work
+    when they reach the process that opened the channel: run a single worker
+    (see create_calendar_watcher).
+    """
+
+    def __init__(self, service_for, address, on_change, on_watch=None, ttl=604800, renew_before=3600,
+                 active_window=86400, debounce=2.0, tick=1.0, max_retry_delay=300):
+        self.service_for = service_for
+        self.address = address
+        self.on_change = on_change
+        self.on_watch = on_watch
+        self.ttl = ttl
+        self.renew_before = renew_before
+        self.active_window = active_window
+        self.debounce = debounce
+        self.tick = tick
+        self.max_retry_delay = max_retry_delay
+        self._channels = {}
+        self._by_user = {}
+        self._active = {}
+        self._pending = {}
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'notifications': 0, 'rejected': 0, 'syncs': 0, 'watches': 0, 'renewals': 0, 'failures': 0, 'last_error': None}
+
+    def track(self, user_id):
+        with self._lock:
+            self._active[user_id] = time.monotonic()
+
+    def notify(self, channel_id, resource_id, token, state):
+        """
+        Handle one notification from its X-Goog-Channel-ID, X-Goog-Resource-ID,
+        X-Goog-Channel-Token and X-Goog-Resource-State headers. Returns the
+        HTTP status to answer with.
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None or channel.resource_id != resource_id or not hmac.compare_digest(channel.token, token or ''):
+                self._stats['rejected'] += 1
+                return 404 if channel is None else 403
+            self._stats['notifications'] += 1
+            # 'sync' only confirms that a new channel is open.
+            if state != 'sync':
+                self._pending.setdefault((channel.user_id, channel.calendar_id), time.monotonic() + self.debounce)
+        return 200
+
+    def _watch(self, user_id, calendar_id='primary'):
+        channel_id = str(uuid.uuid4())
+        token = secrets.token_urlsafe(32)
+        response = self.service_for(user_id).events().watch(calendarId=calendar_id, body={
+            'id': channel_id,
+            'type': 'web_hook',
+            'address': self.address,
+            'token': token,
+            'params': {'ttl': str(self.ttl)},
+        }).execute()
+        expires_at = int(response['expiration']) / 1000 if response.get('expiration') else time.time() + self.ttl
+        channel = Channel(channel_id, user_id, calendar_id, response['resourceId'], token, expires_at)
+        with self._lock:
+            old = self._channels.get(self._by_user.get(user_id))
+            self._channels[channel_id] = channel
+            self._by_user[user_id] = channel_id
+        if old is not None:
+            # The old channel stays registered until it's stopped, so no
+            # notification falls into a gap during renewal.
+            self._close(old)
+        elif self.on_watch is not None:
+            self.on_watch(user_id, calendar_id, True)
+        return channel
+
+    def _close(self, channel, lapsed=False):
+        with self._lock:
+            self._channels.pop(channel.id, None)
+            if self._by_user.get(channel.user_id) == channel.id:
+                del self._by_user[channel.user_id]
+        if lapsed and self.on_watch is not None:
+            self.on_watch(channel.user_id, channel.calendar_id, False)
+        try:
+            self.service_for(channel.user_id).channels().stop(body={'id': channel.id, 'resourceId': channel.resource_id}).execute()
+        except Exception as e:
+            print(f"Stopping calendar channel {channel.id} failed: {e}")
+
+    def _record_failure(self, user_id, error):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._stats['last_error'] = f"{user_id}: {error}"
+
+    def run_once(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, at in self._pending.items() if at <= now]
+            for key in due:
+                del self._pending[key]
+            inactive = [user_id for user_id, seen in self._active.items() if now - seen > self.active_window]
+            for user_id in inactive:
+                del self._active[user_id]
+            unwatched = [user_id for user_id in self._active if user_id not in self._by_user]
+            expiring = [
+                channel for channel in self._channels.values()
+                if channel.expires_at - time.time() < self.renew_before and self._by_user.get(channel.user_id) == channel.id
+            ]
+            lapsed = [self._channels[self._by_user[user_id]] for user_id in inactive if user_id in self._by_user]
+
+        for key in due:
+            try:
+                self.on_change(*key)
+                self._stats['syncs'] += 1
+                self._attempts.pop(key, None)
+            except Exception as e:
+                self._record_failure(key[0], e)
+                attempts = self._attempts[key] = self._attempts.get(key, 0) + 1
+                retry_at = time.monotonic() + min(self.debounce * 2 ** attempts, self.max_retry_delay)
+                with self._lock:
+                    self._pending[key] = min(self._pending.get(key, retry_at), retry_at)
+        for channel in lapsed:
+            self._close(channel, lapsed=True)
+        for user_id in unwatched:
+            try:
+                self._watch(user_id)
+                self._stats['watches'] += 1
+            except Exception as e:
+                # Not retried until the user's next chat turn tracks them again.
+                self._record_failure(user_id, e)
+                with self._lock:
+                    self._active.pop(user_id, None)
+        lapsed_users = {channel.user_id for channel in lapsed}
+        for channel in expiring:
+            if channel.user_id in lapsed_users:
+                continue
+            try:
+                self._watch(channel.user_id, channel.calendar_id)
+                self._stats['renewals'] += 1
+            except Exception as e:
+                self._record_failure(channel.user_id, e)
+                with self._lock:
+                    self._active.pop(channel.user_id, None)
+                self._close(channel, lapsed=True)
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Calendar watcher run failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="calendar-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Channels live only in this process, so close them rather than leave
+        # Google posting to channels nobody recognises.
+        for channel in list(self._channels.values()):
+            self._close(channel)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'channels': len(self._channels), 'pending': len(self._pending), 'tracked_users': len(self._active)}
+
+
+def create_calendar_watcher(service_for, on_change, on_watch=None):
+    # Push notifications need a public HTTPS address for Google to post to.
+    address = os.environ.get("SCIO_CALENDAR_WEBHOOK_URL")
+    if not address:
+        return None
+    # Channel state isn't shared between processes: with several workers a
+    # notification can land on one that never opened the channel while the
+    # owner keeps trusting its mirror. Run uvicorn with a single worker to
+    # use push notifications; otherwise the mirror falls back to polling.
+    if int(os.environ.get("WEB_CONCURRENCY", 1)) > 1:
+        print("Calendar push notifications need a single worker; using polling instead.")
+        return None
+    return CalendarWatcher(
+        service_for, address, on_change, on_watch,
+        ttl=int(os.environ.get("SCIO_CALENDAR_WATCH_TTL", 604800)),
+        renew_before=int(os.environ.get("SCIO_CALENDAR_WATCH_RENEW_BEFORE", 3600)),
+        debounce=float(os.environ.get("SCIO_CALENDAR_WATCH_DEBOUNCE", 2.0)),
+    )
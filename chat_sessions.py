@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class UserSession:
+    __slots__ = ('user_id', 'turns', 'size', 'last_active', 'memory', 'memory_size', 'memory_at')
+
+    def __init__(self, user_id, max_turns):
+        self.user_id = user_id
+        self.turns = deque(maxlen=max_turns)
+        self.size = 0
+        self.last_active = time.monotonic()
+        self.memory = None
+        self.memory_size = 0
+        self.memory_at = 0.0
+
+
+def turn_size(turn):
+    return sum(len(str(message.get('content', ''))) for message in turn)
+
+
+class SessionStore:
+    """
+    Per-user conversation sessions with bounded memory.
+
+    Each session keeps only its last `max_turns` turns (a turn being the list of
+    messages exchanged in one request). Sessions are kept in LRU order; idle
+    ones are dropped after `idle_ttl` seconds, and the least recently used are
+    evicted whenever there are more than `max_sessions` of them or their
+    combined content exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_turns=20, max_sessions=1000, idle_ttl=1800, max_bytes=32 * 1024 * 1024):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _touch(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = UserSession(user_id, self.max_turns)
+            self._sessions[user_id] = session
+        else:
+            self._sessions.move_to_end(user_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def _drop(self, user_id):
+        session = self._sessions.pop(user_id)
+        self._size -= session.size
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_active >= cutoff and len(self._sessions) <= self.max_sessions and self._size <= self.max_bytes:
+                break
+            self._drop(user_id)
+
+    def add_turn(self, user_id, turn):
+        size = turn_size(turn)
+        with self._lock:
+            session = self._touch(user_id)
+            if len(session.turns) == session.turns.maxlen:
+                dropped = turn_size(session.turns[0])
+                session.size -= dropped
+                self._size -= dropped
+            session.turns.append(turn)
+            session.size += size
+            self._size += size
+            self._evict()
+        return turn
+
+    def memory_snapshot(self, user_id, max_age):
+        # The memory retrieved earlier in the session, if it is recent enough
+        # to answer a follow-up message without searching again.
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None or session.memory is None:
+                return None
+            if time.monotonic() - session.memory_at > max_age:
+                return None
+            return session.memory
+
+    def set_memory_snapshot(self, user_id, memory):
+        size = len(str(memory))
+        with self._lock:
+            session = self._touch(user_id)
+            session.size += size - session.memory_size
+            self._size += size - session.memory_size
+            session.memory = memory
+            session.memory_size = size
+            session.memory_at = time.monotonic()
+            self._evict()
+
+    def history(self, user_id):
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                return []
+            return [message for turn in session.turns for message in turn]
+
+    def clear(self, user_id):
+        with self._lock:
+            if user_id in self._sessions:
+                self._drop(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self._size,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes,
+            }
+
+
+sessions = SessionStore(
+    max_turns=int(os.environ.get("SCIO_SESSION_TURNS", 20)),
+    max_sessions=int(os.environ.get("SCIO_SESSION_MAX_USERS", 1000)),
+    idle_ttl=int(os.environ.get("SCIO_SESSION_IDLE_SECONDS", 1800)),
+    max_bytes=int(os.environ.get("SCIO_SESSION_MAX_BYTES", 32 * 1024 * 1024)),
+)
@@ -1,12 +1,19 @@
 from firebase_config import db
-from fastapi import HTTPException, Request
+from fastapi import HTTPException
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from googleapiclient.discovery import build
 from firebase_admin import auth
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from typing import Dict
+from utils.cache import TTLCache
+from utils.concurrency import LockStripes
 
 load_dotenv()
 
@@ -32,41 +39,189 @@ flow = Flow.from_client_secrets_file(
     redirect_uri="https://scio-plan-backend.onrender.com/oauth2callback"
 )
 
-def get_user_credentials(user_id: str):
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+# Tokens are refreshed this long before they expire, so a request never
+# starts with a token that dies halfway through a multi-tool turn.
+REFRESH_SKEW = timedelta(seconds=int(os.environ.get("SCIO_TOKEN_REFRESH_SKEW", 300)))
+
+
+class CachedCredentials:
+    __slots__ = ('user_info', 'credentials')
+
+    def __init__(self, user_info, credentials):
+        self.user_info = user_info
+        self.credentials = credentials
+
+
+# Live Credentials per user, so tool calls don't read users/{uid} from
+# Firestore and rebuild Credentials each time.
+credential_cache = TTLCache(
+    maxsize=int(os.environ.get("SCIO_CREDENTIALS_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("SCIO_CREDENTIALS_CACHE_TTL", 3600)),
+)
+_user_lock = LockStripes()
+# Where refreshes happen: on the request path or in the background refresher.
+refresh_counts = {'inline': 0, 'background': 0}
+# Refreshed tokens are written back to Firestore off the request path.
+_token_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="token-writeback")
+
+# Optionally keep cached credentials coherent across workers with a Firestore
+# listener on users/{uid}, so a token refreshed elsewhere replaces ours.
+LISTEN_FOR_CHANGES = os.environ.get("SCIO_CREDENTIALS_LISTENER", "0") == "1"
+MAX_LISTENERS = int(os.environ.get("SCIO_CREDENTIALS_MAX_LISTENERS", 200))
+_listeners = OrderedDict()
+_listeners_lock = threading.Lock()
+
+def parse_expiry(expires_at):
+    # google-auth works with naive UTC datetimes.
+    if not expires_at:
+        return None
+    expiry = datetime.fromisoformat(expires_at)
+    if expiry.tzinfo is not None:
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    return expiry
+
+def make_credentials(user_info):
+    return Credentials(
+        token=user_info['access_token'],
+        refresh_token=user_info['refresh_token'],
+        token_uri=os.environ.get('TOKEN_URI') or TOKEN_URI,
+        client_id=os.environ.get('GOOGLE_CLIENT_ID'), # Get from .env
+        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'), # Get from .env
+        expiry=parse_expiry(user_info.get('expires_at'))
+    )
+
+def needs_refresh(creds: Credentials, skew: timedelta = REFRESH_SKEW):
+    # Without a known expiry the token is used until Google rejects it, at
+    # which point the authorized HTTP client refreshes it.
+    return creds.expiry is not None and creds.expiry - skew <= datetime.utcnow()
+
+def credentials_ttl(creds: Credentials):
+    # Seconds until the credentials are due for a refresh, or None if unknown.
+    if creds.expiry is None:
+        return None
+    return (creds.expiry - REFRESH_SKEW - datetime.utcnow()).total_seconds()
+
+def _listen(user_id: str):
+    def on_snapshot(docs, changes, read_time):
+        for doc in docs:
+            user_info = doc.to_dict()
+            if not user_info or 'refresh_token' not in user_info or 'access_token' not in user_info:
+                credential_cache.pop(user_id)
+                continue
+            entry = credential_cache.get(user_id)
+            if entry is None or entry.user_info.get('access_token') != user_info['access_token']:
+                credential_cache.set(user_id, CachedCredentials(user_info, make_credentials(user_info)))
+
+    with _listeners_lock:
+        if user_id in _listeners:
+            _listeners.move_to_end(user_id)
+            return
+        _listeners[user_id] = db.collection('users').document(user_id).on_snapshot(on_snapshot)
+        while len(_listeners) > MAX_LISTENERS:
+            _, watch = _listeners.popitem(last=False)
+            watch.unsubscribe()
+
+def _load(user_id: str):
     user_info = db.collection('users').document(user_id).get().to_dict()
     if user_info and 'refresh_token' in user_info and 'access_token' in user_info:
-        return user_info
+        entry = CachedCredentials(user_info, make_credentials(user_info))
+        credential_cache.set(user_id, entry)
+        if LISTEN_FOR_CHANGES:
+            _listen(user_id)
+        return entry
     else:
         raise HTTPException(status_code=401, detail="User not authenticated or missing credentials")
 
-    
-def refreshing_token(user_id: str):
-    user_info = get_user_credentials(user_id)
-    refresh_token = user_info['refresh_token']
-    access_token = user_info['access_token']
-    creds = Credentials(
-        token=access_token,
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.environ.get('GOOGLE_CLIENT_ID'), # Get from .env
-        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET') # Get from .env
-    )
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
+def _cached(user_id: str):
+    entry = credential_cache.get(user_id)
+    if entry is None:
+        with _user_lock(user_id):
+            entry = credential_cache.get(user_id) or _load(user_id)
+    return entry
 
+def _store_user_fields(user_id: str, updated: dict):
+    try:
+        db.collection('users').document(user_id).update(updated)
+    except Exception as e:
+        print(f"Failed to store user fields for {user_id}: {e}")
 
-        # Update the firestore
-        user_ref = db.collection('users').document(user_id)
-        user_ref.update({
+def _refresh(user_id: str, skew: timedelta = REFRESH_SKEW, source: str = 'inline'):
+    # Only one refresh per user runs at a time; threads that were waiting
+    # on it find fresh credentials in the cache and return them.
+    with _user_lock(user_id):
+        entry = credential_cache.get(user_id) or _load(user_id)
+        if not needs_refresh(entry.credentials, skew):
+            return entry, False
+        # Refresh a copy so threads still holding the old object keep a
+        # consistent (and still valid) token while this is in flight.
+        creds = make_credentials(entry.user_info)
+        creds.refresh(GoogleAuthRequest())
+        updated = {
             'access_token': creds.token,
             'expires_at': creds.expiry.isoformat()
-        })
-        return 'Token refreshed'
-    elif not creds.expired and creds.refresh_token:
-        return 'Token not expired and can be used'
-    else:
+        }
+        entry = CachedCredentials({**entry.user_info, **updated}, creds)
+        credential_cache.set(user_id, entry)
+        _token_writer.submit(_store_user_fields, user_id, updated)
+        refresh_counts[source] += 1
+        return entry, True
+
+def store_user_fields(user_id: str, fields: dict):
+    # Saves extra per-user settings next to the tokens: the cached copy is
+    # updated now and Firestore in the background.
+    with _user_lock(user_id):
+        entry = credential_cache.peek(user_id)
+        if entry is not None:
+            credential_cache.set(user_id, CachedCredentials({**entry.user_info, **fields}, entry.credentials))
+    _token_writer.submit(_store_user_fields, user_id, fields)
+
+def cached_expiry(user_id: str):
+    # Expiry of the cached token without loading or touching the entry.
+    entry = credential_cache.peek(user_id)
+    return None if entry is None else entry.credentials.expiry
+
+def refresh_if_expiring(user_id: str, within: timedelta):
+    # Used by the background refresher to renew tokens ahead of requests.
+    _, refreshed = _refresh(user_id, within, source='background')
+    return refreshed
+
+def get_credentials(user_id: str) -> Credentials:
+    entry = _cached(user_id)
+    if needs_refresh(entry.credentials):
+        entry, _ = _refresh(user_id)
+    return entry.credentials
+
+def get_user_credentials(user_id: str):
+    return _cached(user_id).user_info
+
+    
+def refreshing_token(user_id: str):
+    entry = _cached(user_id)
+    if not entry.credentials.refresh_token:
         print("Token not refreshed")
         raise HTTPException(status_code=401, detail="User not authenticated")
+    if needs_refresh(entry.credentials):
+        _, refreshed = _refresh(user_id)
+        if refreshed:
+            return 'Token refreshed'
+    return 'Token not expired and can be used'
+
+def prefetch_user_credentials(user_id: str):
+    # Warm the cache (and refresh an expiring token) ahead of the tool calls
+    # of a chat turn. Failures are left for the tools themselves to report.
+    try:
+        return refreshing_token(user_id)
+    except Exception as e:
+        print(f"Credential prefetch failed for {user_id}: {e}")
+        return None
+
+def shutdown_credentials():
+    _token_writer.shutdown(wait=True)
+    with _listeners_lock:
+        while _listeners:
+            _, watch = _listeners.popitem()
+            watch.unsubscribe()
 
 def login_redirect(credentials: Credentials):
     user_info_service = build('oauth2', 'v2', credentials=credentials)
@@ -87,6 +242,7 @@ def login_redirect(credentials: Credentials):
         'expires_at': credentials.expiry.isoformat()
     }
     user_ref.set(user_data, merge=True)
+    credential_cache.pop(user.uid)
 
     # Store tokens in global dictionary
     user_token_update(user.uid)
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from functools import partial
+import google_auth_httplib2
+import httplib2
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from google_auth import credentials_ttl, get_credentials
+from user_context import UserContext
+from utils.cache import TTLCache
+
+# Parsed discovery documents, loaded once per process.
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+# Built service objects per (user, api, version). An entry lives no longer
+# than the access token it was built with.
+service_cache = TTLCache(
+    maxsize=int(os.environ.get("SCIO_SERVICE_CACHE_SIZE", 512)),
+    ttl=int(os.environ.get("SCIO_SERVICE_CACHE_TTL", 3300)),
+)
+
+# httplib2.Http is not thread-safe, so each worker thread gets its own
+# connection pool and every request is wrapped with the owning user's
+# credentials. Cached services can then be shared across threads.
+_thread_http = threading.local()
+
+
+def discovery_document(name, version):
+    document = _discovery_documents.get((name, version))
+    if document is None:
+        with _discovery_lock:
+            document = _discovery_documents.get((name, version))
+            if document is None:
+                document = json.loads(discovery_cache.get_static_doc(name, version))
+                _discovery_documents[(name, version)] = document
+    return document
+
+
+def thread_http():
+    http = getattr(_thread_http, 'http', None)
+    if http is None:
+        http = _thread_http.http = httplib2.Http()
+    return http
+
+
+def request_builder(credentials):
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(google_auth_httplib2.AuthorizedHttp(credentials, http=thread_http()), *args, **kwargs)
+    return build_request
+
+
+def get_service(name: str, version: str, user_id: str = None):
+    user_id = user_id or UserContext.get_user_id()
+    key = (user_id, name, version)
+    service = service_cache.get(key)
+    if service is not None:
+        return service
+    creds = get_credentials(user_id)
+    service = build_from_document(
+        discovery_document(name, version),
+        http=google_auth_httplib2.AuthorizedHttp(creds, http=thread_http()),
+        requestBuilder=request_builder(creds),
+    )
+    # Expire together with the token so a cached service is never left
+    # holding credentials that are due for a refresh.
+    ttl = credentials_ttl(creds)
+    if ttl is None or ttl > 0:
+        service_cache.set(key, service, ttl=None if ttl is None else min(ttl, service_cache.ttl))
+    return service
+
+
+def iter_pages(list_method, fields, **params):
+    """
+    Lazily page through a Google API list method, yielding each response.
+    `fields` is the partial-response projection; it must include
+    nextPageToken for paging to continue.
+    """
+    page_token = None
+    while True:
+        response = list_method(pageToken=page_token, fields=fields, **params).execute()
+        yield response
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def iter_items(list_method, item_fields, limit=None, page_size=100, **params):
+    """
+    Lazily yield the items of a Google API list method, fetching only
+    `item_fields` of each. With a limit, pages are sized to what is still
+    needed and no page is fetched past it.
+    """
+    remaining = limit
+    page_token = None
+    while remaining is None or remaining > 0:
+        max_results = page_size if remaining is None else min(page_size, remaining)
+        response = list_method(
+            pageToken=page_token, maxResults=max_results,
+            fields=f"nextPageToken,items({item_fields})", **params
+        ).execute()
+        for item in response.get('items', []):
+            yield item
+            if remaining is not None:
+                remaining -= 1
+                if remaining == 0:
+                    return
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+# Most Google APIs accept at most 50 calls in one batch request.
+BATCH_LIMIT = 50
+
+
+def execute_batch(service, requests, user_id: str = None):
+    """
+    Send API requests as batch HTTP requests of up to BATCH_LIMIT calls each.
+    Returns a (response, error) pair per request, in order. A batch that
+    fails as a whole (HTTP or transport error) fails only its own calls;
+    the results of the other batches are still returned.
+    """
+    user_id = user_id or UserContext.get_user_id()
+    http = google_auth_httplib2.AuthorizedHttp(get_credentials(user_id), http=thread_http())
+    results = [None] * len(requests)
+
+    def collect(index, request_id, response, exception):
+        results[index] = (response, exception)
+
+    for start in range(0, len(requests), BATCH_LIMIT):
+        batch = service.new_batch_http_request()
+        for index in range(start, min(start + BATCH_LIMIT, len(requests))):
+            batch.add(requests[index], callback=partial(collect, index))
+        try:
+            batch.execute(http=http)
+        except Exception as error:
+            print(f"Batch request failed: {error}")
+            for index in range(start, min(start + BATCH_LIMIT, len(requests))):
+                if results[index] is None:
+                    results[index] = (None, error)
+    return results
+
+
+def get_calendar_service(user_id: str = None):
+    return get_service('calendar', 'v3', user_id)
+
+
+def get_tasks_service(user_id: str = None):
+    return get_service('tasks', 'v1', user_id)
+
+
+def invalidate_services(user_id: str):
+    service_cache.discard_where(lambda key: key[0] == user_id)
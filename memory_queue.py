@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PendingWrite:
+    __slots__ = ('messages', 'attempts', 'ready_at', 'enqueued_at')
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.attempts = 0
+        self.ready_at = 0.0
+        self.enqueued_at = time.monotonic()
+
+
+class MemoryWriteQueue:
+    """
+    Write-behind queue for memory writes.
+
+    Turns are handed over with `put` and written by a background thread, so the
+    request that produced them doesn't wait for the remote call. Turns queued
+    for the same user before the worker gets to them are coalesced into a
+    single write of at most `max_batch_messages` messages. Failed writes are
+    retried with exponential backoff, and `stop` flushes whatever is left.
+    """
+
+    def __init__(self, write, max_batch_messages=20, max_retries=5, base_backoff=1.0, max_backoff=60.0):
+        self._write = write
+        self.max_batch_messages = max_batch_messages
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._in_flight = 0
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'retries': 0,
+            'failed': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'total_flush_latency': 0.0,
+        }
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="memory-write-queue", daemon=True)
+            self._thread.start()
+
+    def put(self, user_id, messages):
+        with self._cond:
+            pending = self._pending.get(user_id)
+            if pending is None:
+                self._pending[user_id] = PendingWrite(messages)
+            else:
+                pending.messages.extend(messages)
+            self._stats['enqueued'] += len(messages)
+            self._cond.notify()
+
+    def stop(self, timeout=30.0):
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._thread = None
+
+    def _next_ready(self):
+        # Called with the lock held. Returns the first batch that is due, or
+        # how long to wait before one is.
+        now = time.monotonic()
+        wait = None
+        for user_id, pending in self._pending.items():
+            if self._stopping or pending.ready_at <= now:
+                return user_id, None
+            delay = pending.ready_at - now
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _take(self):
+        with self._cond:
+            while True:
+                user_id, wait = self._next_ready()
+                if user_id is not None:
+                    break
+                if self._stopping:
+                    return None, None
+                self._cond.wait(wait)
+            pending = self._pending.pop(user_id)
+            if len(pending.messages) > self.max_batch_messages:
+                rest = PendingWrite(pending.messages[self.max_batch_messages:])
+                rest.enqueued_at = pending.enqueued_at
+                pending.messages = pending.messages[:self.max_batch_messages]
+                self._pending[user_id] = rest
+                self._pending.move_to_end(user_id, last=False)
+            self._in_flight += len(pending.messages)
+            return user_id, pending
+
+    def _requeue(self, user_id, pending):
+        # Called with the lock held. Anything queued for the user since the
+        # batch was taken is appended so message order is preserved.
+        newer = self._pending.pop(user_id, None)
+        if newer is not None:
+            pending.messages.extend(newer.messages)
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (pending.attempts - 1)))
+        pending.ready_at = time.monotonic() + delay
+        self._pending[user_id] = pending
+
+    def _run(self):
+        while True:
+            user_id, pending = self._take()
+            if user_id is None:
+                return
+            try:
+                self._write(pending.messages, user_id)
+                error = None
+            except Exception as e:
+                error = e
+            with self._cond:
+                self._in_flight -= len(pending.messages)
+                if error is None:
+                    latency = time.monotonic() - pending.enqueued_at
+                    self._stats['written'] += len(pending.messages)
+                    self._stats['batches'] += 1
+                    self._stats['last_flush_latency'] = latency
+                    self._stats['max_flush_latency'] = max(self._stats['max_flush_latency'], latency)
+                    self._stats['total_flush_latency'] += latency
+                    continue
+                pending.attempts += 1
+                if self._stopping or pending.attempts > self.max_retries:
+                    print(f"Dropping memory write for {user_id}: {error}")
+                    self._stats['failed'] += len(pending.messages)
+                else:
+                    self._stats['retries'] += 1
+                    self._requeue(user_id, pending)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = sum(len(pending.messages) for pending in self._pending.values())
+            stats['pending_users'] = len(self._pending)
+            stats['in_flight'] = self._in_flight
+            stats['avg_flush_latency'] = stats['total_flush_latency'] / stats['batches'] if stats['batches'] else 0.0
+            del stats['total_flush_latency']
+            return stats
+
+
+def create_memory_queue(write):
+    return MemoryWriteQueue(
+        write,
+        max_batch_messages=int(os.environ.get("SCIO_MEMORY_BATCH_MESSAGES", 20)),
+        max_retries=int(os.environ.get("SCIO_MEMORY_MAX_RETRIES", 5)),
+    )
@@ -1,61 +1,112 @@
 from user_context import UserContext
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from datetime import datetime, timedelta
+from itertools import islice
 from google_auth import *
-from google.oauth2.credentials import Credentials
+from google_services import execute_batch, get_calendar_service, get_tasks_service, iter_items
 from tavily import TavilyClient
 import json
 import pytz
 import os
+import time
 from firebase_config import db
+from utils.cache import TTLCache
+from utils.concurrency import FANOUT_THREADS, fanout_executor
+from calendar_mirror import create_calendar_mirror
+from tasks_mirror import create_tasks_mirror
+from availability import common_free, find_free, preferred_windows, rank_slots, to_timestamp
+from study_scheduler import StudyTask, plan_study_sessions
 from mem0 import MemoryClient
 
 client = MemoryClient(api_key=os.environ.get("MEM0AI_API_KEY"))
 
+# Memory search results per (user, normalized query). Entries for a user are
+# dropped whenever add_memory writes for that user.
+memory_cache = TTLCache(
+    maxsize=int(os.environ.get("SCIO_MEMORY_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("SCIO_MEMORY_CACHE_TTL", 300)),
+)
+memory_search_seconds = {'misses': 0, 'total': 0.0}
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
 def add_memory(history, user_id):
     print("adding memory")
     client.add(history, user_id=user_id)
+    memory_cache.discard_where(lambda key: key[0] == user_id)
     print("processing memory")
     return "memory added"
 
 def search_memory(query: str, user_id: str):
+    key = (user_id, normalize_query(query))
+    memory = memory_cache.get(key)
+    if memory is not None:
+        return memory
     try:
         print("searching memory")
+        started = time.perf_counter()
         memory = client.search(query, user_id=user_id, output_format="v1.1")
+        memory_search_seconds['misses'] += 1
+        memory_search_seconds['total'] += time.perf_counter() - started
+        memory_cache.set(key, memory)
         print("done searching")
         return memory 
     except HttpError as error:
         return f"An error occurred: {error}"
 
+def memory_cache_stats():
+    stats = memory_cache.stats()
+    misses = memory_search_seconds['misses']
+    average = memory_search_seconds['total'] / misses if misses else 0.0
+    stats['avg_search_seconds'] = average
+    stats['saved_seconds'] = stats['hits'] * average
+    return stats
+
 
 #helper functions
-def get_user_timezone():
-    user_id = UserContext.get_user_id()
+# The calendar timezone rarely changes, so it is kept in the user's Firestore
+# document next to the tokens (and so cached with them) and only re-read from
+# the Calendar settings after this long.
+TIMEZONE_TTL = timedelta(seconds=int(os.environ.get("SCIO_TIMEZONE_TTL", 7 * 24 * 3600)))
+
+def get_user_timezone(user_id: str = None):
+    user_id = user_id or UserContext.get_user_id()
     user_info = get_user_credentials(user_id)
-    creds = Credentials(user_info['access_token'])
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    cached = user_info.get('timezone')
+    fetched_at = user_info.get('timezone_fetched_at')
+    if cached and fetched_at and datetime.utcnow() - datetime.fromisoformat(fetched_at) < TIMEZONE_TTL:
+        return cached
+    calendar_service = get_calendar_service(user_id)
     try:
         settings = calendar_service.settings().get(setting='timezone').execute()
+        store_user_fields(user_id, {
+            'timezone': settings['value'],
+            'timezone_fetched_at': datetime.utcnow().isoformat()
+        })
         return settings['value']
     except HttpError as error:
         print(f"An error occurred while retrieving user timezone: {error}")
-        return 'UTC'  # Default to UTC if unable to retrieve user's timezone
+        return cached or 'UTC'  # Default to UTC if unable to retrieve user's timezone
 
 def validate_date(date_str):
        try:
            datetime.fromisoformat(date_str)
            return True
-       except ValueError:
+       except (TypeError, ValueError):
            return False
 
 def validate_time(time_str):
        try:
            datetime.fromisoformat(time_str)
            return True
-       except ValueError:
+       except (TypeError, ValueError):
            return False
 
+# Partial-response projections for the list reads: only what the tools print.
+EVENT_SUMMARY_FIELDS = "id,summary,start,end"
+TASK_SUMMARY_FIELDS = "id,title,notes,status,due"
+
 def format_event_details(event):
        start = event['start'].get('dateTime', event['start'].get('date'))
        start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
@@ -83,6 +134,35 @@ def log_function_call(func):
 
 # Google Calendar API
 
+# Updates are PATCHes of just the changed fields. When a local copy of the
+# resource is cached, its ETag is sent as If-Match so an edit made elsewhere
+# in the meantime is detected (412) instead of silently overwritten; the
+# write is then retried against the current version.
+PRECONDITION_RETRIES = 2
+
+def execute_conditionally(make_request, etag, current_etag):
+    for attempt in range(PRECONDITION_RETRIES + 1):
+        request = make_request()
+        if etag:
+            request.headers['If-Match'] = etag
+        try:
+            return request.execute()
+        except HttpError as error:
+            if error.resp.status != 412 or attempt == PRECONDITION_RETRIES:
+                raise
+            etag = current_etag()
+
+# Local copy of users' calendars kept current with sync tokens; reads are
+# served from it. None when disabled with SCIO_CALENDAR_MIRROR=0.
+calendar_mirror = create_calendar_mirror(get_calendar_service)
+
+def calendar_mirror_stats():
+    return calendar_mirror.stats() if calendar_mirror is not None else None
+
+def mirror_event(event):
+    if calendar_mirror is not None:
+        calendar_mirror.apply(UserContext.get_user_id(), event)
+
 
 def get_calendar_list():
     """
@@ -103,24 +183,40 @@ def get_calendar_list():
     """
     try:
         
-        user_id = UserContext.get_user_id()
-        user_info = get_user_credentials(user_id)
-        refreshing_token(user_id)
-        creds = Credentials(user_info['access_token'],
-                            refresh_token=user_info['refresh_token'],
-                            token_uri=os.environ.get('TOKEN_URI'),
-                            client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                            client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                            )
-        calendar_service = build('calendar', 'v3', credentials=creds)
-
-        calendar_service = build('calendar', 'v3', credentials=creds)
+        calendar_service = get_calendar_service()
         calendars = calendar_service.calendarList().list().execute()
         return "\n".join([f"{calendar['summary']} ({calendar['id']})" for calendar in calendars.get('items', [])])
     except HttpError as error:
         return f"An error occurred: {error}"
 
 
+def event_body(summary, start_time, end_time, timezone, description=None, location=None, color_id=None,
+               guests_can_invite_others=False, recurrence=None):
+    event = {
+        'summary': summary,
+        'start': {
+            'dateTime': start_time,
+            'timeZone': timezone,
+        },
+        'end': {
+            'dateTime': end_time,
+            'timeZone': timezone,
+        },
+    }
+    # Add optional fields if provided
+    if description:
+        event['description'] = description
+    if location:
+        event['location'] = location
+    if color_id:
+        event['colorId'] = color_id
+    if guests_can_invite_others:
+        event['guestsCanInviteOthers'] = guests_can_invite_others
+    if recurrence:
+        event['recurrence'] = recurrence
+    return event
+
+
 def create_calendar_event(summary: str, start_time: str, end_time: str, timezone:str = None, description: str = None, location: str =None, color_id: str = None, guests_can_invite_others: bool = False, recurrence: str = None, sendUpdates: str = None)-> str:
     """
     Create a new event in the user's primary Google Calendar.
@@ -150,47 +246,17 @@ def create_calendar_event(summary: str, start_time: str, end_time: str, timezone
         HttpError: If there's an issue with the Google Calendar API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    calendar_service = get_calendar_service()
     if timezone is None:
         timezone = get_user_timezone()
     if not validate_time(start_time) or not validate_time(end_time):
         return "Invalid start or end time format. Please use ISO 8601 format (e.g., 2024-03-08T10:00:00-08:00)."
-    event = {
-        'summary': summary,
-        'start': {
-            'dateTime': start_time,
-            'timeZone': timezone,
-        },
-        'end': {
-            'dateTime': end_time,
-            'timeZone': timezone,
-        },
-    }
-    # Add optional fields if provided
-    if description:
-        event['description'] = description
-    if location:
-        event['location'] = location
-    if color_id:
-        event['colorId'] = color_id
-    if guests_can_invite_others:
-        event['guestsCanInviteOthers'] = guests_can_invite_others
-    if sendUpdates:
-        event['sendUpdates'] = sendUpdates
-    if recurrence:
-        event['recurrence'] = recurrence
+    event = event_body(summary, start_time, end_time, timezone, description, location, color_id,
+                       guests_can_invite_others, recurrence)
 
     try:
-        event = calendar_service.events().insert(calendarId="primary", body=event).execute()
+        event = calendar_service.events().insert(calendarId="primary", body=event, sendUpdates=sendUpdates).execute()
+        mirror_event(event)
         return f"Event created successfully. Link: {event.get('htmlLink')}"
     except HttpError as error:
         return f"An error occurred: {error}"
@@ -216,23 +282,92 @@ def quick_add_event(text: str, sendUpdates: str = None):
         HttpError: If there's an issue with the Google Calendar API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    calendar_service = get_calendar_service()
     try:
         event = calendar_service.events().quickAdd(calendarId="primary", text=text, sendUpdates=sendUpdates).execute()
+        mirror_event(event)
         return f"Event created successfully. Link: {event.get('htmlLink')}"
     except HttpError as error:
         return f"An error occurred: {error}"
 
 
+def format_batch_results(kind, labels, results):
+    created = sum(1 for _, error in results if error is None)
+    lines = [f"Created {created} of {len(results)} {kind}."]
+    for label, (_, error) in zip(labels, results):
+        if error is not None:
+            lines.append(f"- Failed: {label}: {error}")
+    return "\n".join(lines)
+
+
+def create_calendar_events_batch(events: str, sendUpdates: str = None) -> str:
+    """
+    Create several events in the user's primary calendar at once, e.g. every lecture or exam from a syllabus.
+
+    Args:
+        events (str): A JSON list of events, each with 'summary', 'start_time' and 'end_time' (ISO 8601), and
+                      optionally 'description', 'location', 'timezone' and 'color_id'.
+        sendUpdates (str, optional): Whether to send notifications about the new events.
+                                     Options are "all", "externalOnly", or "none".
+
+    Returns:
+        str: How many events were created, and which ones failed and why.
+
+    Example:
+        >>> create_calendar_events_batch('[{"summary": "Midterm", "start_time": "2024-03-20T09:00:00-08:00", "end_time": "2024-03-20T11:00:00-08:00"}]')
+        "Created 1 of 1 events."
+    """
+    try:
+        items = json.loads(events)
+    except ValueError as e:
+        return f"Invalid events JSON: {e}"
+    if not isinstance(items, list):
+        return "Invalid events JSON: expected a list of events."
+    calendar_service = get_calendar_service()
+    default_timezone = None
+    labels, results, requests, positions = [], [], [], []
+    for item in items:
+        if not isinstance(item, dict):
+            labels.append(str(item))
+            results.append((None, "not an event object"))
+            continue
+        summary = item.get('summary', '')
+        labels.append(summary or '(untitled)')
+        if not (validate_time(item.get('start_time', '')) and validate_time(item.get('end_time', ''))):
+            results.append((None, "invalid or missing start_time/end_time"))
+            continue
+        if item.get('timezone') is None and default_timezone is None:
+            default_timezone = get_user_timezone()
+        body = event_body(summary, item['start_time'], item['end_time'], item.get('timezone') or default_timezone,
+                          item.get('description'), item.get('location'), item.get('color_id'))
+        requests.append(calendar_service.events().insert(calendarId="primary", body=body, sendUpdates=sendUpdates))
+        positions.append(len(results))
+        results.append(None)
+    if requests:
+        for position, (event, error) in zip(positions, execute_batch(calendar_service, requests)):
+            results[position] = (event, error)
+            if error is None:
+                mirror_event(event)
+    return format_batch_results("events", labels, results)
+
+
+def upcoming_mirrored_events(max_results, query=None):
+    # Upcoming primary-calendar events from the mirror, or None without one.
+    # The query matches title, description and location.
+    if calendar_mirror is None:
+        return None
+    events = calendar_mirror.events(UserContext.get_user_id(), time.time())
+    if events is None:
+        return None
+    if query:
+        needle = query.lower()
+        events = [
+            event for event in events
+            if any(needle in event.get(field, '').lower() for field in ('summary', 'description', 'location'))
+        ]
+    return events[:max_results]
+
+
 def get_calendar_events(max_results: int = 10, query: str = None):
     """
     Retrieve a list of upcoming events from the user's primary calendar.
@@ -253,24 +388,19 @@ def get_calendar_events(max_results: int = 10, query: str = None):
     Raises:
         HttpError: If there's an issue with the Google Calendar API request.
     """
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    try:
+        events = upcoming_mirrored_events(max_results, query)
+        if events is not None:
+            if not events:
+                return "No upcoming events found."
+            return "\n".join([format_event_details(event) for event in events])
+    except HttpError as error:
+        print(f"Calendar mirror sync failed: {error}")
+    calendar_service = get_calendar_service()
     try:
         now = datetime.utcnow().isoformat() + 'Z'
-        events_result = calendar_service.events().list(calendarId="primary", timeMin=now,
-                                                  maxResults=max_results, singleEvents=True,
-                                                  orderBy='startTime', q=query).execute()
-        events = events_result.get('items', [])
-        print("events here")
-        print(events)
+        events = list(iter_items(calendar_service.events().list, EVENT_SUMMARY_FIELDS, limit=max_results, page_size=250,
+                                 calendarId="primary", timeMin=now, singleEvents=True, orderBy='startTime', q=query))
         if not events:
             return "No upcoming events found."
         return "\n".join([format_event_details(event) for event in events])
@@ -296,18 +426,11 @@ def delete_calendar_event(event_id: str):
         HttpError: If there's an issue with the Google Calendar API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    calendar_service = get_calendar_service()
     try:
         calendar_service.events().delete(calendarId="primary", eventId=event_id).execute()
+        if calendar_mirror is not None:
+            calendar_mirror.remove(UserContext.get_user_id(), event_id)
         return "Event deleted successfully."
     except HttpError as error:
         return f"An error occurred: {error}"
@@ -345,52 +468,84 @@ def update_calendar_event(event_id: str, summary: str = None, start_time: str =
         HttpError: If there's an issue with the Google Calendar API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
-    if timezone is None:
-        timezone = get_user_timezone()
+    calendar_service = get_calendar_service()
+    body = {}
+    if summary:
+        body['summary'] = summary
+    if start_time:
+        if not validate_time(start_time):
+            return "Invalid start time format. Please use ISO 8601 format (e.g., 2024-03-08T10:00:00-08:00)."
+        body['start'] = {'dateTime': start_time}
+    if end_time:
+        if not validate_time(end_time):
+            return "Invalid end time format. Please use ISO 8601 format (e.g., 2024-03-08T11:00:00-08:00)."
+        body['end'] = {'dateTime': end_time}
+    if timezone:
+        for key in ('start', 'end'):
+            body.setdefault(key, {})['timeZone'] = timezone
+    if description:
+        body['description'] = description
+    if location:
+        body['location'] = location
+    if color_id:
+        body['colorId'] = color_id
+    if guests_can_invite_others:
+        body['guestsCanInviteOthers'] = guests_can_invite_others
+    if recurrence:
+        body['recurrence'] = recurrence
+    if not body:
+        return "Nothing to update."
 
+    cached = calendar_mirror.event(UserContext.get_user_id(), event_id) if calendar_mirror is not None else None
     try:
-        event = calendar_service.events().get(calendarId="primary", eventId=event_id).execute()
-        if summary:
-            event['summary'] = summary
-        if start_time:
-            if validate_time(start_time):
-                event['start']['dateTime'] = start_time
-            else:
-                return "Invalid start time format. Please use ISO 8601 format (e.g., 2024-03-08T10:00:00-08:00)."
-        if end_time:
-            if validate_time(end_time):
-                event['end']['dateTime'] = end_time
-            else:
-                return "Invalid end time format. Please use ISO 8601 format (e.g., 2024-03-08T11:00:00-08:00)."
-        if description:
-            event['description'] = description
-        if location:
-            event['location'] = location
-        if color_id:
-            event['colorId'] = color_id
-        if guests_can_invite_others:
-            event['guestsCanInviteOthers'] = guests_can_invite_others
-        if sendUpdates:
-            event['sendUpdates'] = sendUpdates
-        if recurrence:
-            event['recurrence'] = recurrence
-        updated_event = calendar_service.events().update(calendarId="primary", eventId=event_id, body=event).execute()
+        updated_event = execute_conditionally(
+            lambda: calendar_service.events().patch(calendarId="primary", eventId=event_id, body=body, sendUpdates=sendUpdates),
+            cached.get('etag') if cached else None,
+            lambda: calendar_service.events().get(calendarId="primary", eventId=event_id, fields="etag").execute()['etag'],
+        )
+        mirror_event(updated_event)
         return f"Event updated successfully. Link: {updated_event.get('htmlLink')}"
     except HttpError as error:
         return f"An error occurred: {error}"
 
 # Google Tasks API
 
+# The task list the task tools use when none is given, per user. Resolving it
+# costs a tasklists().list() call, so it is remembered for a while and
+# forgotten when the Tasks API reports a bad or missing list.
+tasklist_cache = TTLCache(maxsize=1024, ttl=int(os.environ.get("SCIO_TASKLIST_CACHE_TTL", 3600)))
+
+def default_tasklist_id(tasks_service):
+    user_id = UserContext.get_user_id()
+    tasklist_id = tasklist_cache.get(user_id)
+    if tasklist_id is not None:
+        return tasklist_id
+    task_lists = tasks_service.tasklists().list().execute()
+    # Check the number of task lists available
+    if len(task_lists.get('items', [])) == 1:
+        tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
+    elif len(task_lists.get('items', [])) >= 2:
+        tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
+    else:
+        return None
+    tasklist_cache.set(user_id, tasklist_id)
+    return tasklist_id
+
+def forget_tasklist(error: HttpError):
+    if error.resp.status in (400, 404):
+        tasklist_cache.pop(UserContext.get_user_id())
+
+# Local copy of users' task lists kept current with updatedMin delta syncs;
+# get_tasks is served from it. None when disabled with SCIO_TASKS_MIRROR=0.
+tasks_mirror = create_tasks_mirror(get_tasks_service)
+
+def tasks_mirror_stats():
+    return tasks_mirror.stats() if tasks_mirror is not None else None
+
+def mirror_task(tasklist_id, task):
+    if tasks_mirror is not None:
+        tasks_mirror.apply(UserContext.get_user_id(), tasklist_id, task)
+
 
 def get_task_list():
     """
@@ -410,16 +565,7 @@ def get_task_list():
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     try:
         task_lists = tasks_service.tasklists().list().execute()
         return "\n".join([f"{task_list['title']} (ID: {task_list['id']})" for task_list in task_lists.get('items', [])])
@@ -427,7 +573,7 @@ def get_task_list():
         return f"An error occurred: {error}"
 
 
-def create_task(title: str, due_date: str = None, notes: str = None):
+def create_task(title: str, due_date: str = None, notes: str = None, tasklist_id: str = None):
     """
     Create a new task in the user's default task list.
 
@@ -435,6 +581,7 @@ def create_task(title: str, due_date: str = None, notes: str = None):
         title (str): The title of the task.
         due_date (str, optional): The due date of the task in ISO 8601 format (e.g., '2024-03-15').
         notes (str, optional): Additional notes or description for the task.
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
 
     Returns:
         str: A message indicating success and the task's ID, or an error message.
@@ -447,17 +594,7 @@ def create_task(title: str, due_date: str = None, notes: str = None):
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    # user_id = UserContext.get_user_id()
-    user_id = "eX4uO9V5qTQn0nqEiEQ3OEKb8Fy2"
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     task = {
         'title': title,
         'notes': notes
@@ -469,29 +606,86 @@ def create_task(title: str, due_date: str = None, notes: str = None):
             return "Invalid due date format. Please use ISO 8601 format (e.g., 2024-03-15)."
     try:
         
-        # Get the default task list ID
-        task_lists = tasks_service.tasklists().list().execute()
-        # Check the number of task lists available
-        if len(task_lists.get('items', [])) == 1:
-            tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
-        elif len(task_lists.get('items', [])) >= 2:
-            tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
-        else:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
             return "No task lists found."
         # Now, list tasks from the default list
         task = tasks_service.tasks().insert(tasklist=tasklist_id, body=task).execute()
+        mirror_task(tasklist_id, task)
         return f"Task created successfully. ID: {task.get('id')}"
     except HttpError as error:
+        forget_tasklist(error)
+        return f"An error occurred: {error}"
+
+
+def create_tasks_batch(tasks: str, tasklist_id: str = None) -> str:
+    """
+    Create several tasks at once, e.g. every deadline from a syllabus.
+
+    Args:
+        tasks (str): A JSON list of tasks, each with a 'title' and optionally 'due_date' (YYYY-MM-DD) and 'notes'.
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
+
+    Returns:
+        str: How many tasks were created, and which ones failed and why.
+
+    Example:
+        >>> create_tasks_batch('[{"title": "Essay draft", "due_date": "2024-03-15"}, {"title": "Lab report"}]')
+        "Created 2 of 2 tasks."
+    """
+    try:
+        items = json.loads(tasks)
+    except ValueError as e:
+        return f"Invalid tasks JSON: {e}"
+    if not isinstance(items, list):
+        return "Invalid tasks JSON: expected a list of tasks."
+    tasks_service = get_tasks_service()
+    try:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
+            return "No task lists found."
+        labels, results, requests, positions = [], [], [], []
+        for item in items:
+            if not isinstance(item, dict):
+                labels.append(str(item))
+                results.append((None, "not a task object"))
+                continue
+            labels.append(item.get('title') or '(untitled)')
+            if not item.get('title'):
+                results.append((None, "missing title"))
+                continue
+            task = {'title': item['title'], 'notes': item.get('notes')}
+            if item.get('due_date'):
+                if not validate_date(item['due_date']):
+                    results.append((None, "invalid due_date"))
+                    continue
+                task['due'] = f"{item['due_date'][:10]}T00:00:00Z"
+            requests.append(tasks_service.tasks().insert(tasklist=tasklist_id, body=task))
+            positions.append(len(results))
+            results.append(None)
+        if requests:
+            for position, (task, error) in zip(positions, execute_batch(tasks_service, requests)):
+                results[position] = (task, error)
+                if error is None:
+                    mirror_task(tasklist_id, task)
+        return format_batch_results("tasks", labels, results)
+    except HttpError as error:
+        forget_tasklist(error)
         return f"An error occurred: {error}"
 
 
-def get_tasks(max_results: int = 10, query: str = None):
+def get_tasks(max_results: int = 10, query: str = None, tasklist_id: str = None, status: str = "needsAction",
+              due_after: str = None, due_before: str = None):
     """
     Retrieve a list of tasks from the user's default Google Tasks list.
 
     Args:
         max_results (int, optional): The maximum number of tasks to return. Defaults to 10.
-        query (str, optional): A search term to filter tasks. If provided, only tasks containing this term will be returned.
+        query (str, optional): A search term to filter tasks. If provided, only tasks whose title or notes contain this term will be returned.
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
+        status (str, optional): "needsAction" for open tasks (the default), "completed" for finished ones, or "all".
+        due_after (str, optional): Only return tasks due on or after this date (YYYY-MM-DD).
+        due_before (str, optional): Only return tasks due before this date (YYYY-MM-DD).
 
     Returns:
         str: A formatted string containing the list of tasks, or a message if no tasks are found.
@@ -506,42 +700,49 @@ def get_tasks(max_results: int = 10, query: str = None):
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     try:
-        # Get the default task list ID
-        task_lists = tasks_service.tasklists().list().execute()
-        # Check the number of task lists available
-        if len(task_lists.get('items', [])) == 1:
-            tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
-        elif len(task_lists.get('items', [])) >= 2:
-            tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
-        else:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
             return "No task lists found."
-        # Now, list tasks from the default list
-        tasks = tasks_service.tasks().list(tasklist=tasklist_id, maxResults=max_results, showCompleted=False).execute()
-        task_list = tasks.get('items', [])
+        for date in (due_after, due_before):
+            if date and not validate_date(date):
+                return "Invalid date format. Please use ISO 8601 format (e.g., 2024-03-15)."
+        status = None if status == "all" else status
+        if tasks_mirror is not None:
+            task_list = tasks_mirror.query(
+                UserContext.get_user_id(), tasklist_id, status=status, text=query, limit=max_results,
+                due_after=due_after[:10] if due_after else None,
+                due_before=due_before[:10] if due_before else None,
+            )
+        else:
+            tasks = iter_items(
+                tasks_service.tasks().list, TASK_SUMMARY_FIELDS,
+                tasklist=tasklist_id, showCompleted=status != "needsAction",
+                dueMin=f"{due_after[:10]}T00:00:00Z" if due_after else None,
+                dueMax=f"{due_before[:10]}T00:00:00Z" if due_before else None,
+            )
+            matching = (
+                task for task in tasks
+                if (status is None or task.get('status') == status)
+                and (not query or query.lower() in f"{task.get('title', '')} {task.get('notes', '')}".lower())
+            )
+            task_list = list(islice(matching, max_results))
         if not task_list:
             return "No tasks found."
         return "\n".join([format_task_details(task) for task in task_list])
     except HttpError as error:
+        forget_tasklist(error)
         return f"An error occurred: {error}"
 
 
-def delete_task(task_id: str):
+def delete_task(task_id: str, tasklist_id: str = None):
     """
     Delete a specific task from the user's default task list.
 
     Args:
         task_id (str): The unique identifier of the task to be deleted.
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
 
     Returns:
         str: A message indicating success or an error message.
@@ -554,34 +755,22 @@ def delete_task(task_id: str):
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     try:
-        # Get the default task list ID
-        task_lists = tasks_service.tasklists().list().execute()
-        # Check the number of task lists available
-        if len(task_lists.get('items', [])) == 1:
-            tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
-        elif len(task_lists.get('items', [])) >= 2:
-            tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
-        else:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
             return "No task lists found."
         # Now, list tasks from the default list
         tasks_service.tasks().delete(tasklist=tasklist_id, task=task_id).execute()
+        if tasks_mirror is not None:
+            tasks_mirror.remove(UserContext.get_user_id(), tasklist_id, task_id)
         return "Task deleted successfully."
     except HttpError as error:
+        forget_tasklist(error)
         return f"An error occurred: {error}"
 
 
-def update_task(task_id: str, title: str = None, due_date: str = None, status: str = None):
+def update_task(task_id: str, title: str = None, due_date: str = None, status: str = None, tasklist_id: str = None):
     """
     Update an existing task in the user's default task list.
 
@@ -590,6 +779,7 @@ def update_task(task_id: str, title: str = None, due_date: str = None, status: s
         title (str, optional): The updated title of the task.
         due_date (str, optional): The updated due date of the task in ISO 8601 format (e.g., '2024-03-15').
         status (str, optional): The updated status of the task (e.g., 'needsAction', 'completed').
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
 
     Returns:
         str: A message indicating success and the updated task's ID, or an error message.
@@ -602,47 +792,47 @@ def update_task(task_id: str, title: str = None, due_date: str = None, status: s
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     try:
-        # Get the default task list ID
-        task_lists = tasks_service.tasklists().list().execute()
-        # Check the number of task lists available
-        if len(task_lists.get('items', [])) == 1:
-            tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
-        elif len(task_lists.get('items', [])) >= 2:
-            tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
-        else:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
             return "No task lists found."
         # Now, list tasks from the default list
-        task = tasks_service.tasks().get(tasklist=tasklist_id, task=task_id).execute()
+        body = {}
         if title:
-            task['title'] = title
+            body['title'] = title
         if due_date:
             if validate_date(due_date):
-                task['due'] = f"{due_date}T00:00:00Z"
+                body['due'] = f"{due_date}T00:00:00Z"
             else:
                 return "Invalid due date format. Please use ISO 8601 format (e.g., 2024-03-15)."
         if status:
-            task['status'] = status
-        updated_task = tasks_service.tasks().update(tasklist=tasklist_id, task=task_id, body=task).execute()
+            body['status'] = status
+            if status == 'needsAction':
+                # Reopening a task also needs its completion time cleared.
+                body['completed'] = None
+        if not body:
+            return "Nothing to update."
+        cached = tasks_mirror.task(UserContext.get_user_id(), tasklist_id, task_id) if tasks_mirror is not None else None
+        updated_task = execute_conditionally(
+            lambda: tasks_service.tasks().patch(tasklist=tasklist_id, task=task_id, body=body),
+            cached.get('etag') if cached else None,
+            lambda: tasks_service.tasks().get(tasklist=tasklist_id, task=task_id, fields="etag").execute()['etag'],
+        )
+        mirror_task(tasklist_id, updated_task)
         return f"Task updated successfully. ID: {updated_task.get('id')}"
     except HttpError as error:
+        forget_tasklist(error)
         return f"An error occurred: {error}"
 
 
-def clear_tasks():
+def clear_tasks(tasklist_id: str = None):
     """
     Clear all completed tasks from the user's default task list.
 
+    Args:
+        tasklist_id (str, optional): The ID of the task list to use. Defaults to the user's default task list.
+
     Returns:
         str: A message indicating success or an error message.
 
@@ -654,118 +844,217 @@ def clear_tasks():
         HttpError: If there's an issue with the Google Tasks API request.
     """
     
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    tasks_service = build('tasks', 'v1', credentials=creds)
+    tasks_service = get_tasks_service()
     try:
-        # Get the default task list ID
-        task_lists = tasks_service.tasklists().list().execute()
-        # Check the number of task lists available
-        if len(task_lists.get('items', [])) == 1:
-            tasklist_id = task_lists['items'][0]['id']  # Use the only available task list
-        elif len(task_lists.get('items', [])) >= 2:
-            tasklist_id = task_lists['items'][1]['id']  # Use the second task list if available
-        else:
+        tasklist_id = tasklist_id or default_tasklist_id(tasks_service)
+        if tasklist_id is None:
             return "No task lists found."
         # Now, list tasks from the default list
         # Now, clear all tasks from the default list
         tasks_service.tasks().clear(tasklist=tasklist_id).execute()
+        if tasks_mirror is not None:
+            tasks_mirror.mark_stale(UserContext.get_user_id(), tasklist_id)
         return "All tasks cleared successfully."
     except HttpError as error:
+        forget_tasklist(error)
         return f"An error occurred: {error}"
 
 
-def get_free_busy(start_time, end_time, calendar_ids=None):
-    
-    user_id = UserContext.get_user_id()
-    user_info = get_user_credentials(user_id)
-    refreshing_token(user_id)
-    creds = Credentials(user_info['access_token'],
-                        refresh_token=user_info['refresh_token'],
-                        token_uri=os.environ.get('TOKEN_URI'),
-                        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-                        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET')
-                        )
-    calendar_service = build('calendar', 'v3', credentials=creds)
+# IDs of the calendars that count towards a user's free/busy, per user.
+calendar_ids_cache = TTLCache(maxsize=1024, ttl=int(os.environ.get("SCIO_CALENDAR_LIST_CACHE_TTL", 900)))
+# Limits of a single freebusy().query call.
+FREEBUSY_MAX_CALENDARS = 50
+FREEBUSY_MAX_SPAN = timedelta(days=60)
+
+def get_calendar_ids(calendar_service, user_id):
+    calendar_ids = calendar_ids_cache.get(user_id)
     if calendar_ids is None:
         calendar_list = calendar_service.calendarList().list().execute()
-        calendar_ids = [calendar['id'] for calendar in calendar_list.get('items', [])]
+        # The primary calendar is addressed as 'primary', as in the tools, so
+        # it shares their mirror.
+        calendar_ids = ['primary' if calendar.get('primary') else calendar['id'] for calendar in calendar_list.get('items', [])]
+        calendar_ids_cache.set(user_id, calendar_ids)
+    return calendar_ids
+
+def get_free_busy(start_time, end_time, calendar_ids=None, user_id=None):
+    
+    user_id = user_id or UserContext.get_user_id()
+    calendar_service = get_calendar_service(user_id)
+    if calendar_ids is None:
+        calendar_ids = get_calendar_ids(calendar_service, user_id)
     
     # Ensure times are in UTC
     utc = pytz.UTC
     start_time = start_time.astimezone(utc)
     end_time = end_time.astimezone(utc)
     
-    body = {
-        "timeMin": start_time.isoformat(),
-        "timeMax": end_time.isoformat(),
-        "items": [{"id": calendar_id} for calendar_id in calendar_ids]
-    }
-    
+    # Normally one query covers the whole window; only very long windows or
+    # very many calendars are split to stay within the API limits.
+    freebusy = {"calendars": {calendar_id: {"busy": []} for calendar_id in calendar_ids}}
     try:
-        freebusy = calendar_service.freebusy().query(body=body).execute()
+        chunk_start = start_time
+        while chunk_start < end_time:
+            chunk_end = min(end_time, chunk_start + FREEBUSY_MAX_SPAN)
+            for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+                body = {
+                    "timeMin": chunk_start.isoformat(),
+                    "timeMax": chunk_end.isoformat(),
+                    "items": [{"id": calendar_id} for calendar_id in calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]]
+                }
+                result = calendar_service.freebusy().query(body=body).execute()
+                for calendar_id, calendar in result.get('calendars', {}).items():
+                    freebusy["calendars"].setdefault(calendar_id, {"busy": []})["busy"].extend(calendar.get('busy', []))
+            chunk_start = chunk_end
         return freebusy
     except HttpError as error:
         print(f"An error occurred: {error}")
         return None
 
-def find_free_time_slots(start_date, end_date, preferred_hours):
-    free_slots = []
-    current_date = start_date
-    utc = pytz.UTC
-    
-    while current_date <= end_date:
-        day_start = datetime.combine(current_date, datetime.min.time()).replace(tzinfo=utc)
-        day_end = (day_start + timedelta(days=1)).replace(tzinfo=utc)
-        
-        preferred_start = (day_start + timedelta(hours=preferred_hours['start'])).replace(tzinfo=utc)
-        preferred_end = (day_start + timedelta(hours=preferred_hours['end'])).replace(tzinfo=utc)
-        
-        freebusy = get_free_busy(preferred_start, preferred_end)
-        
-        if freebusy:
-            busy_periods = []
-            for calendar in freebusy['calendars'].values():
-                busy_periods.extend(calendar.get('busy', []))
-            
-            busy_periods.sort(key=lambda x: x['start'])
-            current_time = preferred_start
-            
-            for busy in busy_periods:
-                busy_start = datetime.fromisoformat(busy['start']).replace(tzinfo=utc)
-                busy_end = datetime.fromisoformat(busy['end']).replace(tzinfo=utc)
-                
-                if current_time < busy_start:
-                    free_slots.append({
-                        'start': current_time,
-                        'end': busy_start
-                    })
-                current_time = max(current_time, busy_end)
-            
-            if current_time < preferred_end:
-                free_slots.append({
-                    'start': current_time,
-                    'end': preferred_end
-                })
-        
-        current_date += timedelta(days=1)
-    
-    return free_slots
+def get_busy_intervals(start_time, end_time, user_id=None):
+    # Busy periods of all the user's calendars as (start, end) timestamps,
+    # not merged, or None if free/busy could not be retrieved. Served from the
+    # calendar mirror only when every calendar is already mirrored, fresh and
+    # covering the range; otherwise one free/busy query is cheaper than
+    # syncing each calendar.
+    user_id = user_id or UserContext.get_user_id()
+    if calendar_mirror is not None:
+        calendar_ids = get_calendar_ids(get_calendar_service(user_id), user_id)
+        busy = calendar_mirror.busy_intervals(user_id, calendar_ids, start_time.timestamp(), end_time.timestamp())
+        if busy is not None:
+            return busy
+    freebusy = get_free_busy(start_time, end_time, user_id=user_id)
+    if freebusy is None:
+        return None
+    return [
+        (to_timestamp(busy['start']), to_timestamp(busy['end']))
+        for calendar in freebusy['calendars'].values()
+        for busy in calendar.get('busy', [])
+    ]
+
+def find_free_intervals(windows):
+    # Free (start, end) timestamps within the given windows, from a single
+    # free/busy query spanning all of them.
+    if not windows:
+        return []
+    busy = get_busy_intervals(datetime.fromtimestamp(windows[0][0], pytz.UTC), datetime.fromtimestamp(windows[-1][1], pytz.UTC))
+    if busy is None:
+        return []
+    return find_free(busy, windows)
+
+def find_free_time_slots(start_date, end_date, preferred_hours, timezone=None):
+    # Days and preferred hours are in the user's calendar timezone.
+    tz = pytz.timezone(timezone or get_user_timezone())
+    windows = preferred_windows(start_date, end_date, preferred_hours, tz)
+    return [
+        {'start': datetime.fromtimestamp(start, tz), 'end': datetime.fromtimestamp(end, tz)}
+        for start, end in find_free_intervals(windows)
+    ]
+
+# Largest study group find_group_free_time accepts. Capped at the fan-out pool
+# size so every member's free/busy query starts in the same round.
+GROUP_MAX_USERS = min(int(os.environ.get("SCIO_GROUP_MAX_USERS", 20)), FANOUT_THREADS)
+
+def find_group_free_slots(user_ids, start_date, end_date, preferred_hours, duration_minutes=60, timezone=None, max_results=5):
+    # Free/busy of every member is fetched at the same time with that
+    # member's own credentials, so the whole group costs about one round trip.
+    # Members whose calendars can't be read are returned as 'unavailable'.
+    tz = pytz.timezone(timezone or get_user_timezone(user_ids[0]))
+    windows = preferred_windows(start_date, end_date, preferred_hours, tz)
+    if not windows:
+        return {'slots': [], 'unavailable': []}
+    start_time = datetime.fromtimestamp(windows[0][0], pytz.UTC)
+    end_time = datetime.fromtimestamp(windows[-1][1], pytz.UTC)
+    futures = {
+        user_id: fanout_executor.submit(get_busy_intervals, start_time, end_time, user_id=user_id)
+        for user_id in dict.fromkeys(user_ids)
+    }
+    busy_by_user = []
+    unavailable = []
+    for user_id, future in futures.items():
+        try:
+            busy = future.result()
+        except Exception as e:
+            print(f"Free/busy for {user_id} failed: {e}")
+            busy = None
+        if busy is None:
+            unavailable.append(user_id)
+        else:
+            busy_by_user.append(busy)
+    if not busy_by_user:
+        return {'slots': [], 'unavailable': unavailable}
+    slots = rank_slots(common_free(busy_by_user, windows, duration_minutes * 60), max_results)
+    return {
+        'slots': [{'start': datetime.fromtimestamp(start, tz), 'end': datetime.fromtimestamp(end, tz)} for start, end in slots],
+        'unavailable': unavailable,
+    }
+
+def find_group_free_time(user_ids: str, start_date: str, end_date: str, duration_minutes: int = 60,
+                         study_start_hour: int = 9, study_end_hour: int = 21, max_results: int = 5) -> str:
+    """
+    Find times when everyone in a study group is free.
+
+    Args:
+        user_ids (str): A JSON list (or comma-separated string) of the other group members' user IDs.
+                        The current user is always included.
+        start_date (str): The first day to consider, in YYYY-MM-DD format.
+        end_date (str): The last day to consider, in YYYY-MM-DD format.
+        duration_minutes (int, optional): Minimum length of a group session. Defaults to 60.
+        study_start_hour (int, optional): Earliest hour of the day to consider. Defaults to 9.
+        study_end_hour (int, optional): Latest hour of the day to consider. Defaults to 21.
+        max_results (int, optional): Maximum number of slots to return. Defaults to 5.
+
+    Returns:
+        str: The common free slots, longest first, in the current user's timezone, or an error message.
+
+    Example:
+        >>> find_group_free_time('["uid-2", "uid-3"]', "2024-03-11", "2024-03-15", 90)
+        "Times when all 3 group members are free:
+        2024-03-13 14:00 - 2024-03-13 18:30
+        2024-03-11 09:00 - 2024-03-11 11:00"
+    """
+    try:
+        others = json.loads(user_ids) if user_ids.strip().startswith('[') else user_ids.split(',')
+        members = [UserContext.get_user_id()] + [str(user_id).strip() for user_id in others if str(user_id).strip()]
+        members = list(dict.fromkeys(members))
+        if len(members) > GROUP_MAX_USERS:
+            return f"A group can have at most {GROUP_MAX_USERS} members."
+        result = find_group_free_slots(
+            members,
+            datetime.strptime(start_date, "%Y-%m-%d").date(),
+            datetime.strptime(end_date, "%Y-%m-%d").date(),
+            {'start': study_start_hour, 'end': study_end_hour},
+            duration_minutes,
+            timezone=get_user_timezone(),
+            max_results=max_results,
+        )
+    except (ValueError, AttributeError) as e:
+        return f"Invalid group request: {e}"
+
+    lines = []
+    if result['slots']:
+        lines.append(f"Times when all {len(members) - len(result['unavailable'])} group members are free:")
+        for slot in result['slots']:
+            lines.append(f"{slot['start'].strftime('%Y-%m-%d %H:%M')} - {slot['end'].strftime('%Y-%m-%d %H:%M')}")
+    else:
+        lines.append("No common free time found in that range.")
+    if result['unavailable']:
+        lines.append("Could not read the calendars of: " + ", ".join(result['unavailable']))
+    return "\n".join(lines)
+
+# Longest planning horizon schedule_study_time accepts, in days.
+MAX_HORIZON_DAYS = 180
 
 def schedule_study_time(tasks: str, preferences: str, deadlines: str) -> str:
     """
     Create a study schedule based on tasks, user preferences, and deadlines.
 
     Args:
-        tasks (str): A JSON string containing a list of tasks, each with 'title' and 'due_date' keys.
+        tasks (str): A JSON string containing a list of tasks, each with 'title' and 'due_date' keys, and
+                     optionally 'duration_minutes' (total study time needed) and 'priority' (higher is more important).
         preferences (str): A JSON string containing user preferences, including 'study_hours' with 'start' and 'end' keys.
+                           Optional keys: 'horizon_days' (default 7), 'study_minutes' (default study time per task, 60),
+                           'max_session_minutes' (longest single session, 60), 'review_minutes' (30) and
+                           'review_intervals' (list of days after studying to review, default [2]).
         deadlines (str): A JSON string containing deadline information (currently unused in the function).
 
     Returns:
@@ -791,59 +1080,51 @@ def schedule_study_time(tasks: str, preferences: str, deadlines: str) -> str:
            2024-03-15 09:00 - 2024-03-15 09:30"
 
     Note:
-        This function creates a schedule for the next 7 days, allocating 1-hour study sessions and 30-minute review sessions.
+        Tasks are scheduled earliest deadline first (higher priority first for equal deadlines), each study session
+        in the earliest free slot that ends before the task's due date, followed by spaced review sessions.
         It saves the created schedule to the user's document in Firestore.
     """
     tasks = json.loads(tasks)
     preferences = json.loads(preferences)
     deadlines = json.loads(deadlines)
 
-    tasks.sort(key=lambda x: datetime.fromisoformat(x['due_date']))
-
-    schedule = []
-    current_date = datetime.now(pytz.UTC).date()
-    end_date = current_date + timedelta(days=7)
+    timezone = get_user_timezone()
+    tz = pytz.timezone(timezone)
+    now = datetime.now(tz)
+    current_date = now.date()
+    horizon_days = max(1, min(int(preferences.get('horizon_days', 7)), MAX_HORIZON_DAYS))
+    end_date = current_date + timedelta(days=horizon_days)
 
-    free_slots = find_free_time_slots(current_date, end_date, preferences['study_hours'])
+    windows = preferred_windows(current_date, end_date, preferences['study_hours'], tz)
+    free_slots = find_free_intervals(windows)
 
+    study_minutes = preferences.get('study_minutes', 60)
+    study_tasks = []
     for task in tasks:
-        task_deadline = datetime.fromisoformat(task['due_date']).replace(tzinfo=pytz.UTC).date()
-        task_slots = [slot for slot in free_slots if slot['start'].date() <= task_deadline]
-        
-        if task_slots:
-            slot = task_slots[0]
-            study_session = {
-                'type': 'study',
-                'task': task['title'],
-                'start': slot['start'],
-                'end': min(slot['end'], slot['start'] + timedelta(hours=1))
-            }
-            schedule.append(study_session)
-            
-            if study_session['end'] == slot['end']:
-                free_slots.remove(slot)
-            else:
-                slot['start'] = study_session['end']
-            
-            review_date = study_session['start'].date() + timedelta(days=2)
-            review_slots = [s for s in free_slots if s['start'].date() == review_date]
-            if review_slots:
-                review_slot = review_slots[0]
-                review_session = {
-                    'type': 'review',
-                    'task': task['title'],
-                    'start': review_slot['start'],
-                    'end': min(review_slot['end'], review_slot['start'] + timedelta(minutes=30))
-                }
-                schedule.append(review_session)
-                
-                if review_session['end'] == review_slot['end']:
-                    free_slots.remove(review_slot)
-                else:
-                    review_slot['start'] = review_session['end']
+        due_date = datetime.fromisoformat(task['due_date'].replace('Z', '+00:00')).date()
+        study_tasks.append(StudyTask(
+            task['title'],
+            tz.localize(datetime.combine(due_date, datetime.max.time())).timestamp(),
+            task.get('duration_minutes', study_minutes) * 60,
+            task.get('priority', 0),
+        ))
+
+    sessions, unscheduled = plan_study_sessions(
+        study_tasks, free_slots, windows, now.timestamp(),
+        max_session=preferences.get('max_session_minutes', 60) * 60,
+        review_duration=preferences.get('review_minutes', 30) * 60,
+        review_offsets=preferences.get('review_intervals', [2]),
+    )
+    schedule = [
+        {**session, 'start': datetime.fromtimestamp(session['start'], tz), 'end': datetime.fromtimestamp(session['end'], tz)}
+        for session in sessions
+    ]
 
     save_schedule(schedule)
-    return format_schedule(schedule)
+    formatted = format_schedule(schedule)
+    if unscheduled:
+        formatted += "Not enough free time before the due date for: " + ", ".join(unscheduled) + "\n"
+    return formatted
 
 def save_schedule(schedule: list) -> str:
     try:
@@ -0,0 +1,136 @@
+from bisect import bisect_right
+from math import ceil
+
+# Study-session placement over free time slots. Times are POSIX timestamps
+# and durations seconds, as in availability.
+
+
+class SlotIndex:
+    """
+    Free slots indexed for first-fit allocation.
+
+    Slots are sorted and disjoint, and allocations only ever consume a slot
+    from its start, so slot ends never move. A max segment tree over the
+    remaining slot lengths finds the earliest slot that can hold a session in
+    O(log n), and shrinking a slot updates it in O(log n).
+    """
+
+    def __init__(self, slots):
+        self.starts = [start for start, _ in slots]
+        self.ends = [end for _, end in slots]
+        self.size = 1
+        while self.size < max(1, len(slots)):
+            self.size *= 2
+        self.tree = [0.0] * (2 * self.size)
+        for i in range(len(slots)):
+            self.tree[self.size + i] = self.ends[i] - self.starts[i]
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def _update(self, index):
+        node = self.size + index
+        self.tree[node] = max(0.0, self.ends[index] - self.starts[index])
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def _first_at_least(self, lo, duration, node=1, node_lo=0, node_hi=None):
+        # Leftmost leaf index >= lo whose remaining length is >= duration.
+        if node_hi is None:
+            node_hi = self.size
+        if node_hi <= lo or self.tree[node] < duration:
+            return None
+        if node >= self.size:
+            return node - self.size
+        middle = (node_lo + node_hi) // 2
+        found = self._first_at_least(lo, duration, 2 * node, node_lo, middle)
+        if found is None:
+            found = self._first_at_least(lo, duration, 2 * node + 1, middle, node_hi)
+        return found
+
+    def allocate(self, duration, not_before, deadline):
+        """
+        Reserve `duration` seconds in the earliest slot starting no earlier
+        than `not_before` and ending by `deadline`. Returns (start, end) or None.
+        """
+        lo = bisect_right(self.ends, not_before)
+        if lo >= len(self.ends):
+            return None
+        if self.starts[lo] < not_before:
+            # The slot straddles not_before: use its remainder if it fits.
+            if self.ends[lo] - not_before >= duration and not_before + duration <= deadline:
+                return self._take(lo, not_before, duration)
+            lo += 1
+        index = self._first_at_least(lo, duration)
+        if index is None or index >= len(self.starts) or self.starts[index] + duration > deadline:
+            return None
+        return self._take(index, self.starts[index], duration)
+
+    def _take(self, index, start, duration):
+        # Any part of the slot before `start` is given up.
+        self.starts[index] = start + duration
+        self._update(index)
+        return start, start + duration
+
+
+class StudyTask:
+    __slots__ = ('title', 'deadline', 'duration', 'priority')
+
+    def __init__(self, title, deadline, duration, priority=0):
+        self.title = title
+        self.deadline = deadline
+        self.duration = duration
+        self.priority = priority
+
+
+def plan_study_sessions(tasks, free_slots, windows, now, max_session=3600, review_duration=1800, review_offsets=(2,)):
+    """
+    Place study and review sessions for `tasks` into `free_slots`.
+
+    Tasks are placed earliest deadline first, higher priority first among
+    equal deadlines. A task's study time is split into sessions of at most
+    `max_session` seconds, each in the earliest free slot that still ends
+    before the deadline. Reviews are optional, so they only get the time left
+    once every task's study sessions are placed: after a task's last study
+    session, a review of `review_duration` is placed on or after each day
+    offset in `review_offsets`, counted in `windows` (one preferred-hours
+    window per day, sorted).
+
+    Returns (sessions, unscheduled): sessions as dicts with 'type', 'task',
+    'start' and 'end' timestamps, and the titles of tasks that didn't fit.
+    """
+    index = SlotIndex([(max(start, now), end) for start, end in free_slots if end > now])
+    window_starts = [start for start, _ in windows]
+    sessions = []
+    unscheduled = []
+    last_study = []
+    for task in sorted(tasks, key=lambda task: (task.deadline, -task.priority)):
+        count = max(1, ceil(task.duration / max_session))
+        blocks = [task.duration / count] * count
+        placed = []
+        for block in blocks:
+            session = index.allocate(block, now, task.deadline)
+            if session is None:
+                break
+            placed.append(session)
+        if not placed:
+            unscheduled.append(task.title)
+            continue
+        if len(placed) < len(blocks):
+            unscheduled.append(task.title)
+        for start, end in placed:
+            sessions.append({'type': 'study', 'task': task.title, 'start': start, 'end': end})
+        last_study.append((task.title, placed[-1][0]))
+
+    for title, last_start in last_study:
+        study_day = max(0, bisect_right(window_starts, last_start) - 1)
+        for offset in review_offsets:
+            review_day = study_day + offset
+            if review_day >= len(window_starts):
+                break
+            review = index.allocate(review_duration, window_starts[review_day], float('inf'))
+            if review is not None:
+                sessions.append({'type': 'review', 'task': title, 'start': review[0], 'end': review[1]})
+    sessions.sort(key=lambda session: session['start'])
+    return sessions, unscheduled
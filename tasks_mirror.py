@@ -0,0 +1,162 @@
+import os
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from google_services import iter_items
+from utils.cache import TTLCache
+from utils.concurrency import LockStripes
+
+TASK_FIELDS = "id,title,notes,status,due,completed,updated,deleted,hidden,etag"
+_KEEP = ('id', 'title', 'notes', 'status', 'due', 'completed', 'updated', 'hidden', 'etag')
+# updatedMin is re-sent this far before the newest change seen, so changes
+# committed slightly out of order are not missed. Re-applying is harmless.
+SYNC_OVERLAP = timedelta(seconds=60)
+NO_DUE = '9999'
+
+
+def due_day(task):
+    # Tasks only have due dates, sent as midnight UTC, so the index is by day.
+    return task['due'][:10] if task.get('due') else NO_DUE
+
+
+class TaskStore:
+    """
+    Mirror of one task list: tasks by ID, a due-date index and the newest
+    `updated` timestamp seen, which the next delta sync starts from.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.by_due = []
+        self.updated_max = None
+        self.synced_at = float('-inf')
+
+    def remove(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is not None:
+            self.by_due.pop(bisect_left(self.by_due, (due_day(task), task_id)))
+
+    def apply(self, task, synced=True):
+        # Only tasks that came from a sync advance updated_max: a local write
+        # says nothing about other changes made since the last sync.
+        self.remove(task['id'])
+        if synced and task.get('updated') and (self.updated_max is None or task['updated'] > self.updated_max):
+            self.updated_max = task['updated']
+        if task.get('deleted'):
+            return
+        compact = {key: task[key] for key in _KEEP if key in task}
+        compact['text'] = f"{task.get('title', '')}\n{task.get('notes', '')}".lower()
+        self.tasks[task['id']] = compact
+        insort(self.by_due, (due_day(task), task['id']))
+
+    def query(self, status=None, due_after=None, due_before=None, text=None, limit=None):
+        # Tasks by due date (undated last). Due bounds are YYYY-MM-DD days;
+        # due_before is exclusive. Hidden (cleared) tasks are kept so that
+        # un-hiding them is applied, but are not listed, as the API wouldn't.
+        lo = 0 if due_after is None else bisect_left(self.by_due, (due_after,))
+        hi = len(self.by_due) if due_before is None else bisect_left(self.by_due, (due_before,))
+        if due_before is not None or due_after is not None:
+            hi = min(hi, bisect_left(self.by_due, (NO_DUE,)))
+        needle = text.lower() if text else None
+        found = []
+        for _, task_id in self.by_due[lo:hi]:
+            task = self.tasks[task_id]
+            if task.get('hidden'):
+                continue
+            if status is not None and task.get('status') != status:
+                continue
+            if needle and needle not in task['text']:
+                continue
+            found.append(task)
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+
+class TasksMirror:
+    """
+    Per-user, per-task-list local copy of Google Tasks kept current with
+    delta syncs.
+
+    The first read of a list fetches all of its tasks, completed and hidden
+    ones included. Later reads of a mirror older than `max_age` seconds ask
+    only for tasks updated since the newest change seen (updatedMin with
+    showDeleted), so an unchanged list costs one small request, and none at
+    all within max_age. `service_for(user_id)` returns the Tasks service.
+    """
+
+    def __init__(self, service_for, max_age=60, max_lists=2048, idle_ttl=3600):
+        self.service_for = service_for
+        self.max_age = max_age
+        self._stores = TTLCache(maxsize=max_lists, ttl=idle_ttl)
+        self._lock = LockStripes()
+        self._stats = {'full_syncs': 0, 'delta_syncs': 0, 'changes': 0}
+
+    def _list(self, service, tasklist_id, **params):
+        return iter_items(
+            service.tasks().list, TASK_FIELDS, tasklist=tasklist_id, showCompleted=True, showHidden=True, **params
+        )
+
+    def sync(self, user_id, tasklist_id, max_age=None):
+        key = (user_id, tasklist_id)
+        with self._lock(key):
+            store = self._stores.get(key)
+            if store is not None and max_age is not None and time.monotonic() - store.synced_at <= max_age:
+                return store
+            service = self.service_for(user_id)
+            if store is not None and store.updated_max is not None:
+                updated_min = datetime.fromisoformat(store.updated_max.replace('Z', '+00:00')) - SYNC_OVERLAP
+                for task in self._list(service, tasklist_id, showDeleted=True, updatedMin=updated_min.isoformat()):
+                    store.apply(task)
+                    self._stats['changes'] += 1
+                self._stats['delta_syncs'] += 1
+            else:
+                store = TaskStore()
+                for task in self._list(service, tasklist_id):
+                    store.apply(task)
+                self._stats['full_syncs'] += 1
+            store.synced_at = time.monotonic()
+            self._stores.set(key, store)
+            return store
+
+    def query(self, user_id, tasklist_id, **filters):
+        store = self.sync(user_id, tasklist_id, self.max_age)
+        with self._lock((user_id, tasklist_id)):
+            return store.query(**filters)
+
+    def task(self, user_id, tasklist_id, task_id):
+        # The mirrored copy of one task if the list is mirrored, without syncing.
+        store = self._stores.peek((user_id, tasklist_id))
+        return None if store is None else store.tasks.get(task_id)
+
+    def apply(self, user_id, tasklist_id, task):
+        # Write-through of a task the tools just created or changed.
+        key = (user_id, tasklist_id)
+        with self._lock(key):
+            store = self._stores.peek(key)
+            if store is not None:
+                store.apply(task, synced=False)
+
+    def remove(self, user_id, tasklist_id, task_id):
+        key = (user_id, tasklist_id)
+        with self._lock(key):
+            store = self._stores.peek(key)
+            if store is not None:
+                store.remove(task_id)
+
+    def mark_stale(self, user_id, tasklist_id):
+        store = self._stores.peek((user_id, tasklist_id))
+        if store is not None:
+            store.synced_at = float('-inf')
+
+    def invalidate(self, user_id):
+        self._stores.discard_where(lambda key: key[0] == user_id)
+
+    def stats(self):
+        return {**self._stats, 'lists': len(self._stores)}
+
+
+def create_tasks_mirror(service_for):
+    if os.environ.get("SCIO_TASKS_MIRROR", "1") != "1":
+        return None
+    return TasksMirror(service_for, max_age=int(os.environ.get("SCIO_TASKS_MIRROR_MAX_AGE", 60)))
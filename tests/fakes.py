@@ -0,0 +1,75 @@
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+class FakeCalendar:
+    """
+    Stand-in for the Calendar service. Every change to its events bumps a
+    version; sync tokens name the version they were issued at, and listing
+    with one returns only what changed since, cancellations included. Tokens
+    added to `expired` are answered with 410 Gone, and the next `failures`
+    lists with 503. events().watch and
+    channels().stop record the push-notification channels opened and closed.
+    """
+
+    def __init__(self, page_size=2):
+        self.items = {}
+        self.version = 0
+        self.page_size = page_size
+        self.expired = set()
+        self.failures = 0
+        self.calls = []
+        self.watches = []
+        self.stopped = []
+
+    def put(self, event):
+        self.version += 1
+        self.items[event['id']] = (self.version, event)
+
+    def cancel(self, event_id):
+        self.version += 1
+        self.items[event_id] = (self.version, {'id': event_id, 'status': 'cancelled'})
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, singleEvents, showDeleted, fields, pageToken=None, syncToken=None, timeMin=None):
+        self.calls.append('incremental' if syncToken else 'full')
+        if syncToken in self.expired:
+            return FakeRequest(HttpError(httplib2.Response({'status': 410}), b'Sync token is no longer valid'))
+        if self.failures:
+            self.failures -= 1
+            return FakeRequest(HttpError(httplib2.Response({'status': 503}), b'Backend error'))
+        since = int(syncToken) if syncToken else 0
+        items = [
+            event for version, event in sorted(self.items.values(), key=lambda item: item[0])
+            if version > since and (syncToken or event.get('status') != 'cancelled')
+        ]
+        start = int(pageToken or 0)
+        response = {'items': items[start:start + self.page_size], 'timeZone': 'UTC'}
+        if start + self.page_size < len(items):
+            response['nextPageToken'] = str(start + self.page_size)
+        else:
+            response['nextSyncToken'] = str(self.version)
+        return FakeRequest(response)
+
+    def watch(self, calendarId, body):
+        self.watches.append(body)
+        return FakeRequest({'resourceId': f"resource-{calendarId}"})
+
+    def channels(self):
+        return self
+
+    def stop(self, body):
+        self.stopped.append(body['id'])
+        return FakeRequest({})
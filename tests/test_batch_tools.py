@@ -0,0 +1,41 @@
+from unittest import mock
+
+import plan_tools
+
+
+def created(service, requests):
+    return [({'id': str(i)}, None) for i in range(len(requests))]
+
+
+def test_batch_tools_reject_json_that_is_not_a_list():
+    with mock.patch.object(plan_tools, 'get_calendar_service'), mock.patch.object(plan_tools, 'get_tasks_service'):
+        assert plan_tools.create_calendar_events_batch('{"summary": "Exam"}') == "Invalid events JSON: expected a list of events."
+        assert plan_tools.create_tasks_batch('{"title": "Essay"}') == "Invalid tasks JSON: expected a list of tasks."
+
+
+def test_create_calendar_events_batch_reports_bad_entries():
+    events = '["Exam", {"summary": "Lab", "start_time": 5, "end_time": "2026-10-20T11:00:00"}, ' \
+             '{"summary": "Lecture", "start_time": "2026-10-20T09:00:00", "end_time": "2026-10-20T10:00:00"}]'
+    with mock.patch.object(plan_tools, 'get_calendar_service'), \
+            mock.patch.object(plan_tools, 'get_user_timezone', return_value='UTC'), \
+            mock.patch.object(plan_tools, 'execute_batch', side_effect=created), \
+            mock.patch.object(plan_tools, 'calendar_mirror', None):
+        result = plan_tools.create_calendar_events_batch(events)
+    assert result == "\n".join([
+        "Created 1 of 3 events.",
+        "- Failed: Exam: not an event object",
+        "- Failed: Lab: invalid or missing start_time/end_time",
+    ])
+
+
+def test_create_tasks_batch_reports_bad_entries():
+    with mock.patch.object(plan_tools, 'get_tasks_service'), \
+            mock.patch.object(plan_tools, 'default_tasklist_id', return_value='list'), \
+            mock.patch.object(plan_tools, 'execute_batch', side_effect=created), \
+            mock.patch.object(plan_tools, 'tasks_mirror', None):
+        result = plan_tools.create_tasks_batch('["Essay", {"title": "Lab", "due_date": 20261020}, {"title": "Reading"}]')
+    assert result == "\n".join([
+        "Created 1 of 3 tasks.",
+        "- Failed: Essay: not a task object",
+        "- Failed: Lab: invalid due_date",
+    ])
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timezone
+
+from calendar_mirror import CalendarMirror
+from fakes import FakeCalendar
+
+NOW = time.time()
+
+
+def event(event_id, summary, hours_from_now, **fields):
+    start = NOW + hours_from_now * 3600
+    return {
+        'id': event_id, 'summary': summary, 'status': 'confirmed',
+        'start': {'dateTime': datetime.fromtimestamp(start, timezone.utc).isoformat()},
+        'end': {'dateTime': datetime.fromtimestamp(start + 1800, timezone.utc).isoformat()},
+        **fields,
+    }
+
+
+def summaries(events):
+    return [event['summary'] for event in events]
+
+
+def mirror_of(calendar):
+    # max_age=0: every read syncs, so each one shows what the API sent.
+    return CalendarMirror(lambda user_id: calendar, max_age=0)
+
+
+def test_full_sync():
+    calendar = FakeCalendar()
+    for i in range(5):
+        calendar.put(event(f"e{i}", f"Event {i}", i + 1))
+    calendar.put(event('free', "Focus time", 6, transparency='transparent'))
+    mirror = CalendarMirror(lambda user_id: calendar, max_age=60)
+
+    assert summaries(mirror.events('user', NOW)) == ["Event 0", "Event 1", "Event 2", "Event 3", "Event 4", "Focus time"]
+    assert calendar.calls == ['full'] * 3
+    # Transparent events don't count as busy. A fresh mirror is read without
+    # calling the API.
+    assert len(mirror.busy_intervals('user', ['primary'], NOW, NOW + 86400)) == 5
+    assert calendar.calls == ['full'] * 3
+
+
+def test_incremental_sync_applies_updates_and_cancellations():
+    calendar = FakeCalendar()
+    for i in range(3):
+        calendar.put(event(f"e{i}", f"Event {i}", i + 1))
+    mirror = mirror_of(calendar)
+    mirror.events('user', NOW)
+    calendar.calls.clear()
+
+    calendar.put(event('e0', "Moved", 10))
+    calendar.cancel('e1')
+    assert summaries(mirror.events('user', NOW)) == ["Event 2", "Moved"]
+    assert calendar.calls == ['incremental']
+    assert mirror.stats()['changes'] == 2
+
+    calendar.calls.clear()
+    assert summaries(mirror.events('user', NOW)) == ["Event 2", "Moved"]
+    assert calendar.calls == ['incremental']
+
+
+def test_expired_sync_token_resets_to_a_full_sync():
+    calendar = FakeCalendar()
+    calendar.put(event('e0', "Event 0", 1))
+    mirror = mirror_of(calendar)
+    mirror.events('user', NOW)
+    calendar.calls.clear()
+
+    calendar.put(event('e1', "Event 1", 2))
+    calendar.cancel('e0')
+    calendar.expired.add(str(calendar.version - 2))
+    assert summaries(mirror.events('user', NOW)) == ["Event 1"]
+    assert calendar.calls == ['incremental', 'full']
+    assert mirror.stats()['resets'] == 1
+
+    calendar.calls.clear()
+    mirror.events('user', NOW)
+    assert calendar.calls == ['incremental']
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from calendar_mirror import CalendarMirror
+from calendar_watch import CalendarWatcher, create_calendar_watcher
+from fakes import FakeCalendar
+
+DEBOUNCE = 0.2
+
+
+@pytest.fixture
+def calendar():
+    return FakeCalendar()
+
+
+@pytest.fixture
+def watcher(calendar, monkeypatch):
+    mirror = CalendarMirror(lambda user_id: calendar)
+    monkeypatch.setattr(app, 'calendar_mirror', mirror)
+    watcher = CalendarWatcher(
+        lambda user_id: calendar, "https://example.test/calendar/notifications", app.resync_calendar,
+        mirror.set_watched, debounce=DEBOUNCE,
+    )
+    monkeypatch.setattr(app, 'calendar_watcher', watcher)
+    watcher.track('user')
+    watcher.run_once()
+    return watcher
+
+
+def headers(calendar, state='exists', **overrides):
+    channel = calendar.watches[-1]
+    return {
+        'X-Goog-Channel-ID': channel['id'],
+        'X-Goog-Resource-ID': 'resource-primary',
+        'X-Goog-Channel-Token': channel['token'],
+        'X-Goog-Resource-State': state,
+        **overrides,
+    }
+
+
+def post(calendar, **header_args):
+    return TestClient(app.app).post("/calendar/notifications", headers=headers(calendar, **header_args))
+
+
+def test_notifications_are_checked_against_the_channel(calendar, watcher):
+    assert post(calendar, state='sync').status_code == 200
+    assert post(calendar, **{'X-Goog-Channel-Token': 'forged'}).status_code == 403
+    assert post(calendar, **{'X-Goog-Channel-ID': 'unknown'}).status_code == 404
+    assert watcher.stats()['rejected'] == 2
+    # The handshake doesn't mean anything changed.
+    assert watcher.stats()['pending'] == 0
+
+
+def test_a_burst_of_notifications_syncs_once(calendar, watcher):
+    for _ in range(20):
+        assert post(calendar).status_code == 200
+    watcher.run_once()
+    assert calendar.calls == []
+    time.sleep(DEBOUNCE * 1.5)
+    watcher.run_once()
+    watcher.run_once()
+    assert calendar.calls == ['full']
+    assert watcher.stats()['syncs'] == 1
+
+
+def test_a_failed_sync_is_retried_with_backoff(calendar, watcher):
+    calendar.failures = 2
+    assert post(calendar).status_code == 200
+    time.sleep(DEBOUNCE * 1.5)
+    watcher.run_once()
+    assert calendar.calls == ['full']
+
+    # First retry after 2 * debounce, the next after 4 * debounce.
+    time.sleep(DEBOUNCE)
+    watcher.run_once()
+    assert calendar.calls == ['full']
+    time.sleep(DEBOUNCE * 1.5)
+    watcher.run_once()
+    assert calendar.calls == ['full'] * 2
+    time.sleep(DEBOUNCE * 2)
+    watcher.run_once()
+    assert calendar.calls == ['full'] * 2
+    time.sleep(DEBOUNCE * 2.5)
+    watcher.run_once()
+    assert calendar.calls == ['full'] * 3
+    assert watcher.stats()['failures'] == 2
+    assert watcher.stats()['syncs'] == 1
+    assert watcher.stats()['pending'] == 0
+
+
+def test_push_notifications_need_a_single_worker(monkeypatch):
+    monkeypatch.setenv("SCIO_CALENDAR_WEBHOOK_URL", "https://example.test/calendar/notifications")
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert create_calendar_watcher(None, None) is not None
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert create_calendar_watcher(None, None) is None
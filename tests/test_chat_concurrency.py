@@ -0,0 +1,47 @@
+import asyncio
+import time
+from unittest import mock
+
+import httpx
+
+import app
+
+DELAY = 0.3
+REQUESTS = 8
+
+
+def slow_search_memory(message, user_id):
+    time.sleep(DELAY)
+    return []
+
+
+def slow_generate_reply(memory, contents):
+    time.sleep(DELAY)
+    return "ok"
+
+
+async def post_chats(count):
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/chat", data={'message': f"hello {i}", 'user_id': f"user-{i}"})
+            for i in range(count)
+        ))
+        return time.perf_counter() - started, responses
+
+
+def test_chat_requests_run_concurrently():
+    with mock.patch.object(app, 'search_memory', slow_search_memory), \
+            mock.patch.object(app, 'generate_reply', slow_generate_reply), \
+            mock.patch.object(app, 'prefetch_user_credentials', lambda user_id: None), \
+            mock.patch.object(app.memory_queue, 'put'):
+        single, responses = asyncio.run(post_chats(1))
+        assert responses[0].status_code == 200, responses[0].text
+        elapsed, responses = asyncio.run(post_chats(REQUESTS))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json() == {'content': "ok"} for response in responses)
+    # Blocking calls off the event loop: N requests take about as long as one,
+    # not N times as long.
+    assert elapsed < single * 2, f"{REQUESTS} requests took {elapsed:.2f}s, one took {single:.2f}s"
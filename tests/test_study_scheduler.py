@@ -0,0 +1,38 @@
+import random
+
+from availability import free_intervals, merge_intervals
+from study_scheduler import StudyTask, plan_study_sessions
+
+DAY = 86400
+HOUR = 3600
+
+
+def test_reviews_only_use_time_left_after_study():
+    # One free hour a day. The first task's review must not take the hour the
+    # second task needs to study before its deadline.
+    windows = [(day * DAY, day * DAY + HOUR) for day in range(4)]
+    tasks = [StudyTask("A", HOUR, HOUR), StudyTask("B", 2 * DAY, HOUR)]
+    sessions, unscheduled = plan_study_sessions(tasks, windows, windows, 0, review_offsets=(1,))
+    assert unscheduled == []
+    assert [(session['type'], session['task'], session['start']) for session in sessions] == [
+        ('study', "A", 0), ('study', "B", DAY), ('review', "A", 2 * DAY), ('review', "B", 2 * DAY + 1800),
+    ]
+
+
+def test_reviews_never_make_a_task_unschedulable():
+    for seed in range(5):
+        random.seed(seed)
+        windows = [(day * DAY + 8 * HOUR, day * DAY + 22 * HOUR) for day in range(60)]
+        busy = []
+        for _ in range(1500):
+            start = random.choice(windows)[0] + random.randrange(0, 14 * HOUR, 900)
+            busy.append((start, start + random.choice([900, 1800, HOUR])))
+        free = free_intervals(merge_intervals(busy), windows, 1800)
+        tasks = [
+            StudyTask(f"Task {i}", random.randrange(3, 60) * DAY, random.choice([1800, HOUR, 2 * HOUR]))
+            for i in range(300)
+        ]
+        study_only, unscheduled = plan_study_sessions(tasks, free, windows, 0, review_offsets=())
+        sessions, with_reviews = plan_study_sessions(tasks, free, windows, 0, review_offsets=(1, 3, 7))
+        assert with_reviews == unscheduled
+        assert [session for session in sessions if session['type'] == 'study'] == study_only
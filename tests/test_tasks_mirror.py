@@ -0,0 +1,54 @@
+from fakes import FakeRequest
+from tasks_mirror import TasksMirror
+
+
+class FakeTasks:
+    """
+    Stand-in for the Tasks service: tasks().list returns the stored tasks,
+    filtered by updatedMin, showHidden and showDeleted as the API does.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.clock = 0
+
+    def put(self, task_id, **fields):
+        self.clock += 1
+        self.items[task_id] = {'id': task_id, 'updated': f"2026-10-18T10:00:{self.clock:02d}.000Z", **fields}
+
+    def tasks(self):
+        return self
+
+    def list(self, tasklist, showCompleted=True, showHidden=False, showDeleted=False, updatedMin=None,
+             pageToken=None, maxResults=100, fields=None):
+        items = [
+            task for task in self.items.values()
+            if (showHidden or not task.get('hidden'))
+            and (showDeleted or not task.get('deleted'))
+            and (showCompleted or task.get('status') != 'completed')
+            and (updatedMin is None or task['updated'] > updatedMin.replace('+00:00', 'Z'))
+        ]
+        return FakeRequest({'items': items})
+
+
+def titles(tasks):
+    return [task['title'] for task in tasks]
+
+
+def test_cleared_tasks_are_not_listed():
+    service = FakeTasks()
+    service.put('a', title="Essay", status='needsAction')
+    service.put('b', title="Reading", status='completed')
+    mirror = TasksMirror(lambda user_id: service)
+    assert titles(mirror.query('user', 'list')) == ["Essay", "Reading"]
+
+    # Clearing completed tasks hides them.
+    service.put('b', title="Reading", status='completed', hidden=True)
+    mirror.mark_stale('user', 'list')
+    assert titles(mirror.query('user', 'list')) == ["Essay"]
+    assert mirror.query('user', 'list', status='completed') == []
+    assert mirror.stats()['delta_syncs'] == 1
+
+    service.put('b', title="Reading", status='needsAction')
+    mirror.mark_stale('user', 'list')
+    assert titles(mirror.query('user', 'list')) == ["Essay", "Reading"]
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from google_auth import cached_expiry, refresh_if_expiring
+
+
+class TokenRefresher:
+    """
+    Background scheduler that renews the access tokens of recently active
+    users shortly before they expire, so the request path almost never has to
+    refresh inline.
+
+    Every `interval` seconds it picks up to `batch_size` tracked users whose
+    cached token expires within `lead` seconds (soonest first) and refreshes
+    them. Users inactive for longer than `active_window` stop being tracked,
+    and a user whose refresh failed is skipped for `retry_after` seconds.
+    """
+
+    def __init__(self, lead=600, interval=30, batch_size=20, active_window=3600, retry_after=300):
+        self.lead = timedelta(seconds=lead)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.active_window = active_window
+        self.retry_after = retry_after
+        self._active = {}
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'refreshed': 0,
+            'failures': 0,
+            'last_error': None,
+            'last_lag': 0.0,
+            'max_lag': 0.0,
+            'last_run': None,
+        }
+
+    def track(self, user_id):
+        with self._lock:
+            self._active[user_id] = time.monotonic()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _due(self):
+        now = time.monotonic()
+        deadline = datetime.utcnow() + self.lead
+        due = []
+        with self._lock:
+            for user_id, last_active in list(self._active.items()):
+                if now - last_active > self.active_window:
+                    del self._active[user_id]
+                    self._retry_at.pop(user_id, None)
+                    continue
+                if self._retry_at.get(user_id, 0) > now:
+                    continue
+                expiry = cached_expiry(user_id)
+                if expiry is not None and expiry <= deadline:
+                    due.append((expiry, user_id))
+        due.sort()
+        return due[:self.batch_size]
+
+    def run_once(self):
+        for expiry, user_id in self._due():
+            try:
+                refreshed = refresh_if_expiring(user_id, self.lead)
+            except Exception as e:
+                with self._lock:
+                    self._retry_at[user_id] = time.monotonic() + self.retry_after
+                    self._stats['failures'] += 1
+                    self._stats['last_error'] = f"{user_id}: {e}"
+                continue
+            if refreshed:
+                # Lag: how far past the scheduled refresh point (expiry - lead)
+                # the refresh actually happened.
+                lag = max(0.0, (datetime.utcnow() - (expiry - self.lead)).total_seconds())
+                with self._lock:
+                    self._stats['refreshed'] += 1
+                    self._stats['last_lag'] = lag
+                    self._stats['max_lag'] = max(self._stats['max_lag'], lag)
+        with self._lock:
+            self._stats['last_run'] = datetime.utcnow().isoformat()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Token refresher run failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tracked_users'] = len(self._active)
+            return stats
+
+
+token_refresher = TokenRefresher(
+    lead=int(os.environ.get("SCIO_TOKEN_REFRESH_LEAD", 600)),
+    interval=int(os.environ.get("SCIO_TOKEN_REFRESH_INTERVAL", 30)),
+    batch_size=int(os.environ.get("SCIO_TOKEN_REFRESH_BATCH", 20)),
+)
@@ -0,0 +1,79 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from user_context import UserContext
+
+# Gemini, mem0, Firestore and the Google API clients are all synchronous, so
+# every call into them from a request handler goes through this pool instead
+# of running on the event loop.
+WORKER_THREADS = int(os.environ.get("SCIO_WORKER_THREADS", 32))
+
+executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="scio-worker")
+
+# Fan-out from code already running on a worker (e.g. one free/busy query per
+# member of a study group) gets its own pool, so a busy worker pool can never
+# end up waiting on itself. Sized for a few of the largest groups
+# (SCIO_GROUP_MAX_USERS) at once; threads are only started as needed.
+FANOUT_THREADS = int(os.environ.get("SCIO_FANOUT_THREADS", 64))
+
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_THREADS, thread_name_prefix="scio-fanout")
+
+
+# CPU-bound work (image and PDF preprocessing) goes to a separate process pool,
+# created on first use. By then the process runs gRPC, worker and background
+# threads, and forking it could hand a child a lock held by one of them, so
+# workers are started from a clean forkserver process instead.
+PROCESS_WORKERS = int(os.environ.get("SCIO_PROCESS_WORKERS", 2))
+
+process_executor = None
+
+
+class LockStripes:
+    """
+    Per-key locks from a fixed set: keys map to one of `count` locks by hash,
+    so memory stays bounded however many users or calendars are seen. Two
+    keys may share a lock, so never hold one while taking another.
+    """
+
+    def __init__(self, count=64):
+        self._locks = [threading.Lock() for _ in range(count)]
+
+    def __call__(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+
+async def run_in_process(func, *args, **kwargs):
+    global process_executor
+    if process_executor is None:
+        process_executor = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_executor, partial(func, *args, **kwargs))
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def _call_as_user(user_id, func, *args, **kwargs):
+    # UserContext is thread-local, so it has to be set on the worker thread
+    # that actually runs the tools, not on the event loop thread.
+    UserContext.set_user_id(user_id)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        UserContext.clear_user_id()
+
+
+async def run_for_user(user_id, func, *args, **kwargs):
+    return await run_blocking(_call_as_user, user_id, func, *args, **kwargs)
+
+
+def shutdown_executor():
+    executor.shutdown(wait=True)
+    fanout_executor.shutdown(wait=True)
+    if process_executor is not None:
+        process_executor.shutdown(wait=True)
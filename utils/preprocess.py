@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+# Both libraries are optional: without them attachments are uploaded as is.
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif", "image/bmp", "image/tiff"}
+PDF_TYPE = "application/pdf"
+
+
+def can_preprocess(mime_type):
+    if mime_type in IMAGE_TYPES:
+        return Image is not None
+    if mime_type == PDF_TYPE:
+        return PdfReader is not None
+    return False
+
+
+def downscale_image(path, max_side, quality):
+    with Image.open(path) as image:
+        if max(image.size) <= max_side:
+            return None
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode in ("RGBA", "LA", "P"):
+            suffix, mime_type, options = ".png", "image/png", {"format": "PNG", "optimize": True}
+        else:
+            image = image.convert("RGB")
+            suffix, mime_type, options = ".jpg", "image/jpeg", {"format": "JPEG", "quality": quality, "optimize": True}
+        fd, output_path = tempfile.mkstemp(prefix="scio_", suffix=suffix)
+        with os.fdopen(fd, "wb") as output:
+            image.save(output, **options)
+    return {"path": output_path, "mime_type": mime_type}
+
+
+def extract_pdf_text(path, min_chars_per_page):
+    reader = PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    text = "\n\n".join(page.strip() for page in pages)
+    # Scanned PDFs have little or no text layer; those are left for Gemini.
+    if not pages or len(text) < min_chars_per_page * len(pages):
+        return None
+    return {"text": text}
+
+
+def preprocess_file(path, mime_type, max_side=2048, quality=85, min_chars_per_page=200):
+    """
+    Runs in a worker process. Returns None to upload the original unchanged,
+    {"path", "mime_type"} for a smaller replacement file, or {"text"} when a
+    PDF's text can be sent instead of the file.
+    """
+    try:
+        if mime_type == PDF_TYPE:
+            return extract_pdf_text(path, min_chars_per_page)
+        return downscale_image(path, max_side, quality)
+    except Exception as e:
+        print(f"Preprocessing failed for {mime_type} attachment: {e}")
+        return None